@@ -1,10 +1,18 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post, Comment, Follow
+from .utils import CappedCountPaginator
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список без точного COUNT(*) по всей таблице."""
+    paginator = CappedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,10 +20,22 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date', 'author_id')
+    list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
-    list_editable = ('group',)
+
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по тексту через индекс FTS5 вместо LIKE '%...%'."""
+        if not search.fts_enabled() or not search.match_expression(
+            search_term
+        ):
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(pk__in=search.matching_ids(search_term)), False
 
 
 @admin.register(Group)
@@ -31,22 +51,28 @@ class GroupAdmin(admin.ModelAdmin):
         'slug',
         'description',
     )
+    search_fields = ('title', 'slug')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'text',
         'author',
         'created'
     )
+    list_select_related = ('author',)
+    date_hierarchy = 'created'
+    autocomplete_fields = ('author', 'post')
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = (
         'pk',
         'author',
         'user',
     )
+    list_select_related = ('author', 'user')
+    autocomplete_fields = ('author', 'user')
@@ -0,0 +1,158 @@
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import condition, require_safe
+
+from .models import Group, Post
+from .page_cache import (
+    author_scope, feed_etag, group_scope, request_etag
+)
+from .utils import CursorPaginator
+
+User = get_user_model()
+
+API_PAGE_SIZE = 20
+
+
+class ApiField:
+    """Поле ответа: какие колонки нужны из БД и как получить значение."""
+
+    def __init__(self, columns, value):
+        self.columns = columns
+        self.value = value
+
+
+def _author(post):
+    username = post.author.username
+    return {
+        'username': username,
+        'url': reverse('posts:profile', args=[username]),
+    }
+
+
+def _group(post):
+    if post.group is None:
+        return None
+    return {
+        'slug': post.group.slug,
+        'title': post.group.title,
+        'url': reverse('posts:group_list', args=[post.group.slug]),
+    }
+
+
+FEED_FIELDS = {
+    'id': ApiField((), lambda post: post.pk),
+    'text': ApiField(('text',), lambda post: post.text),
+    'pub_date': ApiField((), lambda post: post.pub_date.isoformat()),
+    'author': ApiField(('author__username',), _author),
+    'group': ApiField(('group__slug', 'group__title'), _group),
+    'image': ApiField(
+        ('image',), lambda post: post.image.url if post.image else None
+    ),
+    'url': ApiField(
+        (), lambda post: reverse('posts:post_detail', args=[post.pk])
+    ),
+}
+# Счётчик комментариев не меняет версии лент, поэтому он есть только
+# в ответе для отдельного поста, где ETag учитывает его сам.
+DETAIL_FIELDS = dict(FEED_FIELDS, comments_count=ApiField(
+    ('comments_count',), lambda post: post.comments_count
+))
+
+
+def parse_fields(request, available):
+    """Имена полей из ?fields=a,b; None, если среди них есть неизвестные."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    if not fields or any(name not in available for name in fields):
+        return None
+    return fields
+
+
+def select_fields(queryset, fields, available):
+    """Читает только нужные колонки, авторов и группы — тем же запросом."""
+    # Ключи связей читаются всегда: по ним менеджер group.posts
+    # и author.posts подставляют уже известный объект.
+    columns = {'id', 'pub_date', 'author', 'group'}
+    for name in fields:
+        columns.update(available[name].columns)
+    related = {column.split('__')[0] for column in columns if '__' in column}
+    return queryset.select_related(*related).only(*columns)
+
+
+def serialize(post, fields, available):
+    return {name: available[name].value(post) for name in fields}
+
+
+def _unknown_fields(available):
+    return JsonResponse(
+        {'error': 'Доступные поля: ' + ', '.join(available)}, status=400
+    )
+
+
+def _feed_response(request, queryset):
+    fields = parse_fields(request, FEED_FIELDS)
+    if fields is None:
+        return _unknown_fields(FEED_FIELDS)
+    paginator = CursorPaginator(
+        select_fields(queryset, fields, FEED_FIELDS), API_PAGE_SIZE
+    )
+    page = paginator.get_page(request.GET.get('cursor'))
+    links = {}
+    for name, cursor in (
+        ('next', page.next_cursor), ('previous', page.previous_cursor)
+    ):
+        links[name] = None
+        if cursor is not None:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            links[name] = f'{request.path}?{params.urlencode()}'
+    return JsonResponse({
+        'results': [
+            serialize(post, fields, FEED_FIELDS) for post in page
+        ],
+        **links,
+    })
+
+
+@require_safe
+@condition(etag_func=feed_etag(lambda: ['index']))
+def index(request):
+    return _feed_response(request, Post.objects.all())
+
+
+@require_safe
+@condition(etag_func=feed_etag(lambda slug: [group_scope(slug)]))
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _feed_response(request, group.posts.all())
+
+
+@require_safe
+@condition(etag_func=feed_etag(lambda username: [author_scope(username)]))
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return _feed_response(request, author.posts.all())
+
+
+def _post_etag(request, post_id):
+    state = Post.objects.filter(pk=post_id).values_list(
+        'updated', 'comments_count', 'author__username',
+        'group__slug', 'group__title',
+    ).first()
+    return request_etag(request, *state) if state else None
+
+
+@require_safe
+@condition(etag_func=_post_etag)
+def post_detail(request, post_id):
+    fields = parse_fields(request, DETAIL_FIELDS)
+    if fields is None:
+        return _unknown_fields(DETAIL_FIELDS)
+    post = get_object_or_404(
+        select_fields(Post.objects.all(), fields, DETAIL_FIELDS), pk=post_id
+    )
+    return JsonResponse(serialize(post, fields, DETAIL_FIELDS))
@@ -0,0 +1,179 @@
+import threading
+from bisect import bisect_left
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Group
+
+User = get_user_model()
+
+VERSION_KEY = 'autocomplete-version'
+CHANGE_KEY = 'autocomplete-change:{}'
+CHANGE_TIMEOUT = 60 * 60
+
+_lock = threading.Lock()
+_indexes = None
+_version = 0
+
+
+class PrefixIndex:
+    """Отсортированный список пар (ключ, значение) с поиском по префиксу.
+
+    Поиск — бинарный поиск начала диапазона и проход до первого ключа
+    без префикса, вставка и удаление — bisect по тому же списку.
+    """
+
+    def __init__(self, entries=()):
+        self.entries = sorted(entries)
+
+    def add(self, key, value):
+        entry = (key, value)
+        i = bisect_left(self.entries, entry)
+        if i == len(self.entries) or self.entries[i] != entry:
+            self.entries.insert(i, entry)
+
+    def remove(self, key, value):
+        entry = (key, value)
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def search(self, prefix, limit):
+        found = []
+        i = bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and len(found) < limit:
+            key, value = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            if value not in found:
+                found.append(value)
+            i += 1
+        return found
+
+
+def user_entries(username):
+    return [(username.casefold(), username)]
+
+
+def group_entries(slug, title):
+    value = (slug, title)
+    return [(title.casefold(), value), (slug.casefold(), value)]
+
+
+def _load():
+    users = PrefixIndex(
+        entry
+        for username in User.objects.values_list(
+            'username', flat=True
+        ).iterator()
+        for entry in user_entries(username)
+    )
+    groups = PrefixIndex(
+        entry
+        for slug, title in Group.objects.values_list(
+            'slug', 'title'
+        ).iterator()
+        for entry in group_entries(slug, title)
+    )
+    return {'users': users, 'groups': groups}
+
+
+def _apply(change):
+    kind, op, entries = change
+    for key, value in entries:
+        getattr(_indexes[kind], op)(key, value)
+
+
+def _current_version():
+    """Номер последнего изменения и признак того, что журнал сброшен."""
+    current = cache.get(VERSION_KEY)
+    if current is not None:
+        return current, False
+    # Кэш очищен: какие изменения пропущены, узнать уже нельзя.
+    cache.add(VERSION_KEY, 0, timeout=None)
+    return cache.get(VERSION_KEY, 0), True
+
+
+def _catch_up(current):
+    """Применяет журнал до current под _lock; False, если его не хватает."""
+    global _version
+    if _indexes is None or current < _version:
+        return False
+    if current == _version:
+        return True
+    changes = cache.get_many([
+        CHANGE_KEY.format(n) for n in range(_version + 1, current + 1)
+    ])
+    if len(changes) != current - _version:
+        return False
+    for n in range(_version + 1, current + 1):
+        _apply(changes[CHANGE_KEY.format(n)])
+    _version = current
+    return True
+
+
+def _sync():
+    """Догоняет общий журнал изменений или перечитывает индекс из БД.
+
+    Каждый процесс держит свою копию индекса. Изменения пишутся в общий
+    кэш под последовательными номерами, и отставший процесс применяет
+    недостающие; если часть журнала уже вытеснена — загружает всё заново.
+    Загрузка идёт без блокировки, чтобы поиск в других потоках шёл
+    по прежнему индексу, а готовый индекс подменяется целиком. Изменения
+    применяются идемпотентно, поэтому повтор уже прочитанных из БД
+    безопасен. Возвращает индексы, по которым искать.
+    """
+    global _indexes, _version
+    current, reset = _current_version()
+    with _lock:
+        if reset:
+            _indexes = None
+        if _catch_up(current):
+            return _indexes
+    indexes = _load()
+    with _lock:
+        if _indexes is None or _version != current:
+            _indexes, _version = indexes, current
+        return _indexes
+
+
+def _publish(*changes):
+    global _version
+    for change in changes:
+        try:
+            number = cache.incr(VERSION_KEY)
+        except ValueError:
+            if cache.add(VERSION_KEY, 1, timeout=None):
+                number = 1
+            else:
+                number = cache.incr(VERSION_KEY)
+        cache.set(CHANGE_KEY.format(number), change, CHANGE_TIMEOUT)
+        with _lock:
+            if _indexes is not None and number == _version + 1:
+                _apply(change)
+                _version = number
+
+
+def record(kind, removed=(), added=()):
+    """Публикует изменение индекса после фиксации транзакции."""
+    changes = [
+        (kind, op, list(entries))
+        for op, entries in (('remove', removed), ('add', added))
+        if entries
+    ]
+    if changes:
+        transaction.on_commit(lambda: _publish(*changes))
+
+
+def suggest(prefix, limit):
+    prefix = prefix.strip().casefold()
+    if not prefix:
+        return [], []
+    indexes = _sync()
+    with _lock:
+        return (
+            indexes['users'].search(prefix, limit),
+            indexes['groups'].search(prefix, limit),
+        )
@@ -0,0 +1,106 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+COUNTER_BATCH_SIZE = 1000
+
+
+def change_user_counter(user_id, field, delta):
+    """Атомарно сдвигает счётчик пользователя через F()."""
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats = stats.filter(**{f'{field}__gte': -delta})
+    if not stats.update(**{field: F(field) + delta}) and delta > 0:
+        _, created = UserStats.objects.get_or_create(
+            user_id=user_id, defaults={field: delta}
+        )
+        if not created:
+            stats.update(**{field: F(field) + delta})
+
+
+def change_comments_count(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def get_user_stats(user):
+    """Счётчики пользователя; если строки ещё нет — нулевые."""
+    return UserStats.objects.filter(user=user).first() or UserStats(user=user)
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def _batches(queryset, batch_size):
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :batch_size
+        ])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def reconcile_user_stats(batch_size=COUNTER_BATCH_SIZE):
+    """Чинит расхождения UserStats; возвращает число исправленных строк."""
+    fields = ('posts_count', 'followers_count', 'following_count')
+    users = User.objects.annotate(
+        actual_posts=_count(Post, 'author'),
+        actual_followers=_count(Follow, 'author'),
+        actual_following=_count(Follow, 'user'),
+    )
+    repaired = 0
+    for batch in _batches(users, batch_size):
+        existing = UserStats.objects.in_bulk([user.pk for user in batch])
+        to_create, to_update = [], []
+        for user in batch:
+            actual = (
+                user.actual_posts,
+                user.actual_followers,
+                user.actual_following,
+            )
+            stats = existing.get(user.pk)
+            if stats is None:
+                to_create.append(UserStats(user=user, **dict(
+                    zip(fields, actual)
+                )))
+            elif tuple(getattr(stats, f) for f in fields) != actual:
+                for field, value in zip(fields, actual):
+                    setattr(stats, field, value)
+                to_update.append(stats)
+        UserStats.objects.bulk_create(to_create)
+        UserStats.objects.bulk_update(to_update, fields)
+        repaired += len(to_update) + sum(
+            any(getattr(stats, f) for f in fields) for stats in to_create
+        )
+    return repaired
+
+
+def reconcile_comments_count(batch_size=COUNTER_BATCH_SIZE):
+    """Чинит Post.comments_count; возвращает число исправленных постов."""
+    posts = Post.objects.only('pk', 'comments_count').annotate(
+        actual=_count(Comment, 'post')
+    )
+    repaired = 0
+    for batch in _batches(posts, batch_size):
+        drifted = [
+            post for post in batch if post.comments_count != post.actual
+        ]
+        for post in drifted:
+            post.comments_count = post.actual
+        Post.objects.bulk_update(drifted, ['comments_count'])
+        repaired += len(drifted)
+    return repaired
@@ -0,0 +1,150 @@
+import csv
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Comment, Post
+from .utils import keyset_slice
+
+EXPORT_BATCH_SIZE = 2000
+
+# Поля записей совпадают с форматом import_data.
+EXPORTS = {
+    'post': {
+        'queryset': lambda: Post.objects.all(),
+        'date': 'pub_date',
+        'group': 'group__slug',
+        'author': 'author__username',
+        'fields': {
+            'id': 'id',
+            'author': 'author__username',
+            'group': 'group__slug',
+            'text': 'text',
+            'pub_date': 'pub_date',
+            'image': 'image',
+        },
+    },
+    'comment': {
+        'queryset': lambda: Comment.objects.all(),
+        'date': 'created',
+        'group': 'post__group__slug',
+        'author': 'author__username',
+        'fields': {
+            'id': 'id',
+            'post': 'post_id',
+            'author': 'author__username',
+            'text': 'text',
+            'created': 'created',
+        },
+    },
+}
+
+
+def parse_moment(value, end_of_day=False):
+    """Дата или дата-время из параметра; наивные считаются локальными."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Неверная дата: {value!r}')
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_watermark(value):
+    """Позиция '<дата-время>,<id>', после которой продолжается выгрузка."""
+    moment, _, pk = value.rpartition(',')
+    return parse_moment(moment), int(pk)
+
+
+def parse_filters(params):
+    """Фильтры export_records из параметров запроса или команды.
+
+    Для неверных дат и водяного знака бросает ValueError.
+    """
+    since = params.get('since')
+    until = params.get('until')
+    after = params.get('after')
+    return {
+        'since': parse_moment(since) if since else None,
+        'until': parse_moment(until, end_of_day=True) if until else None,
+        'after': parse_watermark(after) if after else None,
+        'group': params.get('group') or None,
+        'author': params.get('author') or None,
+    }
+
+
+def export_records(kind, since=None, until=None, group=None, author=None,
+                   after=None, batch_size=EXPORT_BATCH_SIZE):
+    """Записи по возрастанию (дата, id), пачками по индексу.
+
+    Каждая пачка — короткий запрос с LIMIT после последней позиции, так
+    что память не зависит от объёма выгрузки, а прерванную выгрузку
+    можно продолжить с водяного знака after.
+    """
+    export = EXPORTS[kind]
+    date = export['date']
+    queryset = export['queryset']().order_by()
+    if since is not None:
+        queryset = queryset.filter(**{f'{date}__gte': since})
+    if until is not None:
+        queryset = queryset.filter(**{f'{date}__lte': until})
+    if group:
+        queryset = queryset.filter(**{export['group']: group})
+    if author:
+        queryset = queryset.filter(**{export['author']: author})
+    fields = export['fields']
+    queryset = queryset.values_list(*fields.values())
+    position = after
+    while True:
+        rows = keyset_slice(
+            queryset, (date, 'id'), position, True, batch_size
+        )
+        for row in rows:
+            yield dict(zip(fields, row))
+        if len(rows) < batch_size:
+            return
+        last = dict(zip(fields.values(), rows[-1]))
+        position = last[date], last['id']
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    # DjangoJSONEncoder обрезает микросекунды, а водяной знак нужен точный.
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def ndjson_lines(records):
+    for record in records:
+        yield json.dumps(
+            record, default=_json_default, ensure_ascii=False
+        ) + '\n'
+
+
+def csv_lines(records, kind):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(EXPORTS[kind]['fields']))
+    for record in records:
+        yield writer.writerow([
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in record.values()
+        ])
+
+
+def export_lines(kind, fmt, **filters):
+    records = export_records(kind, **filters)
+    if fmt == 'csv':
+        return csv_lines(records, kind)
+    return ndjson_lines(
+        dict(record, type=kind) for record in records
+    )
@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from django.views.decorators.http import condition
+
+from .models import Group, Post
+from .page_cache import author_scope, cache_feed, feed_etag, group_scope
+
+User = get_user_model()
+
+FEED_SIZE = 20
+
+
+class PostFeed(Feed):
+    """Последние посты ленты в RSS 2.0."""
+
+    def get_posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.get_posts(obj).select_related(
+            'author', 'group'
+        ).order_by('-pub_date', '-id')[:FEED_SIZE]
+
+    def item_title(self, post):
+        return Truncator(post.text).chars(80)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', args=[post.pk])
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_updateddate(self, post):
+        return post.updated
+
+    def item_author_name(self, post):
+        return post.author.username
+
+    def item_categories(self, post):
+        return [post.group.title] if post.group else []
+
+
+class IndexFeed(PostFeed):
+    title = 'Yatube: последние записи'
+    description = 'Новые посты всех авторов'
+
+    def link(self):
+        return reverse('posts:index')
+
+
+class GroupFeed(PostFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def get_posts(self, group):
+        return group.posts.all()
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('posts:group_list', args=[group.slug])
+
+
+class AuthorFeed(PostFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def get_posts(self, author):
+        return author.posts.all()
+
+    def title(self, author):
+        return f'Yatube: записи {author.username}'
+
+    def description(self, author):
+        return f'Новые посты пользователя {author.username}'
+
+    def link(self, author):
+        return reverse('posts:profile', args=[author.username])
+
+
+class AtomIndexFeed(IndexFeed):
+    feed_type = Atom1Feed
+    subtitle = IndexFeed.description
+
+
+class AtomGroupFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, group):
+        return self.description(group)
+
+
+class AtomAuthorFeed(AuthorFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, author):
+        return self.description(author)
+
+
+def cached_feed(feed, scopes_func):
+    """Лента, которая собирается раз на версию и отвечает 304 по ETag."""
+    return condition(etag_func=feed_etag(scopes_func))(
+        cache_feed(scopes_func)(feed)
+    )
+
+
+index_rss = cached_feed(IndexFeed(), lambda: ['index'])
+index_atom = cached_feed(AtomIndexFeed(), lambda: ['index'])
+group_rss = cached_feed(GroupFeed(), lambda slug: [group_scope(slug)])
+group_atom = cached_feed(AtomGroupFeed(), lambda slug: [group_scope(slug)])
+author_rss = cached_feed(
+    AuthorFeed(), lambda username: [author_scope(username)]
+)
+author_atom = cached_feed(
+    AtomAuthorFeed(), lambda username: [author_scope(username)]
+)
@@ -0,0 +1,207 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import FeedEntry, Follow, Post
+from .utils import CursorPaginator, keyset_slice, paginate_page
+
+FEED_BATCH_SIZE = 500
+MERGE_BATCH_SIZE = 5
+
+
+def _insert_entries(user_ids, posts, batch_size=FEED_BATCH_SIZE):
+    entries = [
+        FeedEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in user_ids
+        for post_id, author_id, pub_date in posts
+    ]
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=batch_size, ignore_conflicts=True
+    )
+
+
+def fan_out_post(post, batch_size=FEED_BATCH_SIZE):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True
+    ).iterator(chunk_size=batch_size)
+    row = [(post.pk, post.author_id, post.pub_date)]
+    chunk = []
+    for user_id in followers:
+        chunk.append(user_id)
+        if len(chunk) == batch_size:
+            _insert_entries(chunk, row, batch_size)
+            chunk = []
+    _insert_entries(chunk, row, batch_size)
+
+
+def backfill_feed(user_id, author_id, batch_size=FEED_BATCH_SIZE):
+    """Добавляет в ленту подписчика все посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'author_id', 'pub_date'
+    ).iterator(chunk_size=batch_size)
+    chunk = []
+    for row in posts:
+        chunk.append(row)
+        if len(chunk) == batch_size:
+            _insert_entries([user_id], chunk, batch_size)
+            chunk = []
+    _insert_entries([user_id], chunk, batch_size)
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_feed(user_id, batch_size=FEED_BATCH_SIZE):
+    """Пересобирает ленту одного пользователя; возвращает число подписок.
+
+    Очистка и наполнение идут одной транзакцией: читатели видят старую
+    ленту до фиксации, а сбой откатывает очистку.
+    """
+    with transaction.atomic():
+        author_ids = list(Follow.objects.filter(
+            user_id=user_id
+        ).values_list('author_id', flat=True))
+        FeedEntry.objects.filter(user_id=user_id).delete()
+        for author_id in author_ids:
+            backfill_feed(user_id, author_id, batch_size)
+    return len(author_ids)
+
+
+def rebuild_feeds(users=None, batch_size=FEED_BATCH_SIZE):
+    """Пересобирает ленты из Follow и Post; возвращает число подписок.
+
+    users — пользователи или их id; по умолчанию все, у кого есть
+    подписки или записи ленты. Каждая лента пересобирается отдельно.
+    """
+    if users is None:
+        user_ids = Follow.objects.order_by().values_list(
+            'user_id', flat=True
+        ).union(FeedEntry.objects.order_by().values_list(
+            'user_id', flat=True
+        ))
+    else:
+        user_ids = get_user_model().objects.filter(
+            pk__in=users
+        ).values_list('pk', flat=True)
+    return sum(
+        rebuild_feed(user_id, batch_size) for user_id in sorted(user_ids)
+    )
+
+
+class FeedPaginator(CursorPaginator):
+    """Курсорная пагинация по FeedEntry, отдающая сами посты."""
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            FeedEntry.objects.filter(user=user).select_related(
+                'post__author', 'post__group'
+            ),
+            per_page,
+            keys=('pub_date', 'post_id'),
+        )
+
+    def fetch(self, position, backward, limit):
+        entries = super().fetch(position, backward, limit)
+        return [entry.post for entry in entries]
+
+    def position(self, post):
+        return post.pub_date, post.pk
+
+
+class MergeFeedPaginator(CursorPaginator):
+    """Лента слиянием при чтении: по курсору на каждого автора.
+
+    Страница стоит O(авторов) запросов: куча берёт у каждого автора
+    первый пост. Поэтому потоки ленивые — посты автора читаются
+    по индексу (author, -pub_date) пачками с растущим LIMIT, начиная
+    с MERGE_BATCH_SIZE, и следующая пачка запрашивается, только если
+    куче понадобились все посты предыдущей.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(
+            Post.objects.filter(author__following__user=user), per_page
+        )
+        self.author_ids = list(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+
+    def author_posts(self, author_id, position, backward, limit):
+        posts = Post.objects.filter(author_id=author_id).select_related(
+            'author', 'group'
+        )
+        batch_size = min(MERGE_BATCH_SIZE, limit)
+        while batch_size:
+            batch = keyset_slice(
+                posts, self.keys, position, backward, batch_size
+            )
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            limit -= batch_size
+            position = self.position(batch[-1])
+            batch_size = min(batch_size * 2, limit)
+
+    def fetch(self, position, backward, limit):
+        streams = [
+            self.author_posts(author_id, position, backward, limit)
+            for author_id in self.author_ids
+        ]
+        merged = heapq.merge(
+            *streams, key=self.position, reverse=not backward
+        )
+        return list(islice(merged, limit))
+
+
+def join_feed_page(request, user, per_page=10):
+    return paginate_page(
+        request,
+        Post.objects.filter(author__following__user=user).select_related(
+            'author', 'group'
+        ),
+        per_page,
+    )
+
+
+def materialized_feed_page(request, user, per_page=10):
+    paginator = FeedPaginator(user, per_page)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+def merge_feed_page(request, user, per_page=10):
+    paginator = MergeFeedPaginator(user, per_page)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+FEED_STRATEGIES = {
+    'join': join_feed_page,
+    'materialized': materialized_feed_page,
+    'merge': merge_feed_page,
+}
+
+
+def follow_feed_page(request, user, per_page=10):
+    """Страница ленты подписок выбранной стратегией.
+
+    Стратегию можно переопределить параметром ?feed=, чтобы сравнивать
+    их на одном развёртывании; ?page=N всегда обслуживается join-запросом.
+    """
+    strategy = request.GET.get('feed')
+    if strategy not in FEED_STRATEGIES:
+        strategy = settings.FOLLOW_FEED_STRATEGY
+    if request.GET.get('page') is not None:
+        strategy = 'join'
+    return FEED_STRATEGIES[strategy](request, user, per_page)
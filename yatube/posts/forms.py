@@ -1,6 +1,10 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
+from .images import normalize_upload
 from .models import Post, Comment
 
 User = get_user_model()
@@ -15,6 +19,27 @@ class PostForm(forms.ModelForm):
             'group': forms.ChoiceField(required=False, )
         }
 
+    def clean_image(self):
+        """Проверяет размеры новой картинки и нормализует её.
+
+        ImageField к этому моменту прочитал только заголовок файла,
+        поэтому слишком большие картинки отклоняются без декодирования.
+        """
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        if image.size > settings.IMAGE_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                'Файл больше %s.'
+                % filesizeformat(settings.IMAGE_MAX_UPLOAD_SIZE)
+            )
+        width, height = image.image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise forms.ValidationError(
+                f'Картинка {width}×{height} слишком большая.'
+            )
+        return normalize_upload(image)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
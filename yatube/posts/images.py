@@ -0,0 +1,170 @@
+import hashlib
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps, ImageSequence
+
+VARIANT_QUALITY = {'AVIF': 60, 'WEBP': 80}
+INGEST_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'WEBP': {'quality': 90},
+    'PNG': {'optimize': True},
+}
+# MPO с камер — JPEG с прикреплёнными кадрами; сохраняем только первый.
+INGEST_FORMATS = {'MPO': 'JPEG'}
+# Из info переносится только то, без чего картинка выглядит иначе.
+INGEST_INFO = ('transparency', 'duration')
+
+_ingest_executor = None
+_ingest_lock = threading.Lock()
+
+
+def variant_formats():
+    """Современные форматы, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [fmt for fmt in ('AVIF', 'WEBP') if fmt in Image.SAVE]
+
+
+def _variant_size(width):
+    geometry, _ = settings.THUMBNAIL_GEOMETRIES['card']
+    card_width, card_height = map(int, geometry.split('x'))
+    return width, round(width * card_height / card_width)
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=VARIANT_QUALITY[fmt])
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage):
+    """Лестница ширин карточки в WebP/AVIF с хэшем содержимого в имени.
+
+    Возвращает манифест {'image/webp': [[ширина, имя], ...], ...}.
+    Имя файла меняется вместе с содержимым, поэтому файлы можно отдавать
+    с бессрочным immutable-кэшированием.
+    """
+    with storage.open(name) as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    manifest = {}
+    for fmt in variant_formats():
+        ladder = manifest.setdefault(f'image/{fmt.lower()}', [])
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            resized = ImageOps.fit(
+                image, _variant_size(width), Image.LANCZOS
+            )
+            content = _encode(resized, fmt)
+            digest = hashlib.sha256(content).hexdigest()[:20]
+            variant_name = '{}{}.{}'.format(
+                settings.IMAGE_VARIANT_DIR, digest, fmt.lower()
+            )
+            if not storage.exists(variant_name):
+                # Хранилище с адресацией по содержимому выберет своё имя.
+                variant_name = storage.save(
+                    variant_name, ContentFile(content)
+                )
+            ladder.append([width, variant_name])
+    return manifest
+
+
+def image_sources(post):
+    """<source> для <picture>: тип и srcset по манифесту поста."""
+    if not post.image or not post.image_variants:
+        return []
+    storage = post.image.storage
+    return [
+        {
+            'type': mime,
+            'srcset': ', '.join(
+                f'{storage.url(name)} {width}w' for width, name in ladder
+            ),
+        }
+        for mime, ladder in json.loads(post.image_variants).items()
+    ]
+
+
+def _clean_frame(frame, max_side):
+    frame = ImageOps.exif_transpose(frame)
+    frame.info = {
+        key: frame.info[key] for key in INGEST_INFO if key in frame.info
+    }
+    frame.thumbnail((max_side, max_side), Image.LANCZOS)
+    return frame
+
+
+def _normalize(source, max_side):
+    """Применяет EXIF-поворот, убирает метаданные и уменьшает картинку.
+
+    Картинка перекодируется всегда, в том числе анимированная: иначе
+    EXIF с геометкой остался бы в файлах, которые не нужно уменьшать.
+    Из метаданных сохраняется только ICC-профиль. source — путь
+    к временному файлу загрузки или её байты. Работает в процессе пула,
+    поэтому настройки получает аргументами.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with Image.open(source) as image:
+        fmt = INGEST_FORMATS.get(image.format, image.format)
+        if fmt not in Image.SAVE:
+            fmt = 'PNG'
+        options = dict(INGEST_OPTIONS.get(fmt, {}))
+        icc_profile = image.info.get('icc_profile')
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        if getattr(image, 'is_animated', False) and fmt != 'JPEG':
+            frames = [
+                _clean_frame(frame.copy(), max_side)
+                for frame in ImageSequence.Iterator(image)
+            ]
+            options.update(
+                save_all=True,
+                append_images=frames[1:],
+                duration=[frame.info.get('duration', 0) for frame in frames],
+                loop=image.info.get('loop', 0),
+            )
+            image = frames[0]
+        else:
+            image = _clean_frame(image, max_side)
+        buffer = BytesIO()
+        image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _get_ingest_executor():
+    global _ingest_executor
+    with _ingest_lock:
+        if _ingest_executor is None:
+            # spawn, а не fork: в процессе сервера уже работают потоки.
+            _ingest_executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_INGEST_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _ingest_executor
+
+
+def normalize_upload(upload):
+    """Загруженная картинка, готовая к сохранению в хранилище.
+
+    Большие загрузки уже лежат во временном файле, и в пул передаётся
+    только путь к нему, так что память воркера не зависит от размера
+    файла. Результат ограничен IMAGE_MAX_SIDE.
+    """
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        upload.seek(0)
+        source = upload.read()
+    args = (source, settings.IMAGE_MAX_SIDE)
+    if settings.IMAGE_INGEST_WORKERS:
+        content = _get_ingest_executor().submit(_normalize, *args).result()
+    else:
+        content = _normalize(*args)
+    return SimpleUploadedFile(upload.name, content, upload.content_type)
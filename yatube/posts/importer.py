@@ -0,0 +1,239 @@
+import csv
+import json
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import autocomplete, counters, follow_feed, page_cache, tags
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+IMPORT_CHUNK_SIZE = 5000
+# Порядок записи внутри пачки: сначала то, на что ссылаются остальные.
+RECORD_TYPES = ('group', 'post', 'comment', 'follow')
+
+
+class ImportDataError(ValueError):
+    """Запись, которую нельзя импортировать."""
+
+
+def read_records(stream, fmt, record_type=None):
+    """Записи NDJSON или CSV по одной, без чтения файла целиком.
+
+    Тип записи берётся из поля type, а для CSV без такой колонки —
+    из record_type.
+    """
+    if fmt == 'csv':
+        rows = csv.DictReader(stream)
+    else:
+        rows = (json.loads(line) for line in stream if line.strip())
+    for row in rows:
+        row.setdefault('type', record_type)
+        if row['type'] not in RECORD_TYPES:
+            raise ImportDataError(
+                f'Неизвестный тип записи: {row["type"]!r}'
+            )
+        yield row
+
+
+@contextmanager
+def explicit_dates():
+    """Отключает auto_now/auto_now_add, чтобы сохранить даты из архива."""
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Post._meta.get_field('updated'),
+        Comment._meta.get_field('created'),
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _parse_date(value):
+    if not value:
+        return timezone.now()
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ImportDataError(f'Неверная дата: {value!r}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class BulkImporter:
+    """Пишет записи пачками через bulk_create, без сигналов на строку.
+
+    Авторы и группы ищутся через словари в памяти: каждое новое имя
+    запрашивается один раз на пачку. Данные, которые обычно поддерживают
+    сигналы (хэштеги, ленты подписок, счётчики, версии кэша), после
+    импорта пересобираются пакетными функциями.
+    """
+
+    def __init__(self, create_users=False):
+        self.create_users = create_users
+        self.user_ids = {}
+        self.group_ids = {}
+        self.scopes = {'index'}
+        self.indexed_posts = True
+        # Чьи ленты подписок затронуты: авторы новых постов и подписчики
+        # из новых подписок.
+        self.post_authors = set()
+        self.feed_users = set()
+
+    def _resolve_users(self, usernames):
+        missing = set(usernames) - set(self.user_ids) - {None, ''}
+        if missing and self.create_users:
+            User.objects.bulk_create(
+                [
+                    User(username=name, password=make_password(None))
+                    for name in missing
+                ],
+                ignore_conflicts=True,
+            )
+        if missing:
+            self.user_ids.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'id'))
+        unknown = missing - set(self.user_ids)
+        if unknown:
+            raise ImportDataError(
+                'Нет пользователей: ' + ', '.join(sorted(unknown))
+            )
+
+    def _resolve_groups(self, slugs):
+        missing = set(slugs) - set(self.group_ids) - {None, ''}
+        if missing:
+            self.group_ids.update(Group.objects.filter(
+                slug__in=missing
+            ).values_list('slug', 'id'))
+        unknown = missing - set(self.group_ids)
+        if unknown:
+            raise ImportDataError(
+                'Нет групп: ' + ', '.join(sorted(unknown))
+            )
+
+    def _write_groups(self, rows):
+        Group.objects.bulk_create(
+            [
+                Group(
+                    slug=row['slug'],
+                    title=row['title'],
+                    description=row.get('description', ''),
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _write_posts(self, rows):
+        self._resolve_users(row['author'] for row in rows)
+        self._resolve_groups(row.get('group') for row in rows)
+        posts = []
+        for row in rows:
+            pub_date = _parse_date(row.get('pub_date'))
+            group = row.get('group')
+            posts.append(Post(
+                id=row.get('id') or None,
+                text=row['text'],
+                author_id=self.user_ids[row['author']],
+                group_id=self.group_ids[group] if group else None,
+                image=row.get('image', ''),
+                pub_date=pub_date,
+                updated=pub_date,
+            ))
+        Post.objects.bulk_create(posts, ignore_conflicts=True)
+        if all(post.pk for post in posts):
+            tags.index_posts(posts)
+        else:
+            # Без явных id SQLite не возвращает ключи из bulk_create.
+            self.indexed_posts = False
+
+    def _write_comments(self, rows):
+        self._resolve_users(row['author'] for row in rows)
+        Comment.objects.bulk_create(
+            [
+                Comment(
+                    id=row.get('id') or None,
+                    post_id=row['post'],
+                    author_id=self.user_ids[row['author']],
+                    text=row['text'],
+                    created=_parse_date(row.get('created')),
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _write_follows(self, rows):
+        self._resolve_users(
+            name for row in rows for name in (row['user'], row['author'])
+        )
+        Follow.objects.bulk_create(
+            [
+                Follow(
+                    user_id=self.user_ids[row['user']],
+                    author_id=self.user_ids[row['author']],
+                )
+                for row in rows
+            ],
+            ignore_conflicts=True,
+        )
+
+    def track(self, records):
+        """Запоминает ленты подписок и версии кэша, которые обновит finish().
+
+        Вызывается и для уже загруженных записей при продолжении импорта,
+        чтобы finish() учёл пачки прошлого запуска.
+        """
+        for record in records:
+            if record['type'] == 'post':
+                self.post_authors.add(record['author'])
+                self.scopes.add(page_cache.author_scope(record['author']))
+                if record.get('group'):
+                    self.scopes.add(page_cache.group_scope(record['group']))
+            elif record['type'] == 'follow':
+                self.feed_users.add(record['user'])
+
+    def write_chunk(self, records):
+        """Записывает пачку одной транзакцией."""
+        self.track(records)
+        by_type = {record_type: [] for record_type in RECORD_TYPES}
+        for record in records:
+            by_type[record['type']].append(record)
+        writers = {
+            'group': self._write_groups,
+            'post': self._write_posts,
+            'comment': self._write_comments,
+            'follow': self._write_follows,
+        }
+        with transaction.atomic(), explicit_dates():
+            for record_type in RECORD_TYPES:
+                if by_type[record_type]:
+                    writers[record_type](by_type[record_type])
+
+    def finish(self):
+        """Пересобирает производные данные после импорта."""
+        if not self.indexed_posts:
+            tags.backfill_tags()
+        if self.post_authors or self.feed_users:
+            follow_feed.rebuild_feeds(User.objects.filter(
+                Q(username__in=self.feed_users)
+                | Q(follower__author__username__in=self.post_authors)
+            ).distinct())
+        counters.reconcile_user_stats()
+        counters.reconcile_comments_count()
+        page_cache.bump_versions(*self.scopes)
+        # Процессы перечитают индекс автодополнения при следующем запросе.
+        cache.delete(autocomplete.VERSION_KEY)
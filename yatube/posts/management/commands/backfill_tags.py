@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.tags import TAG_BATCH_SIZE, backfill_tags
+
+
+class Command(BaseCommand):
+    help = 'Индексирует хэштеги в текстах всех постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=TAG_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        indexed = backfill_tags(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано постов: {indexed}'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts.media import MEDIA_BATCH_SIZE, MEDIA_GC_MIN_AGE, collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки и варианты, на которые не ссылается '
+        'ни один пост, и миниатюры без записи в kvstore.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=MEDIA_GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=MEDIA_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        removed = 0
+        for name in collect_garbage(
+            options['min_age'], options['dry_run'], options['batch_size']
+        ):
+            removed += 1
+            if options['verbosity'] > 1 or options['dry_run']:
+                self.stdout.write(name)
+        verb = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} файлов: {removed}'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.exporter import (
+    EXPORT_BATCH_SIZE, EXPORTS, export_lines, parse_filters
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты или комментарии в NDJSON или CSV потоком, '
+        'пачками по индексу даты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', choices=EXPORTS, default='post')
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'), default='ndjson'
+        )
+        parser.add_argument('--since', help='Дата или дата-время начала.')
+        parser.add_argument('--until', help='Дата или дата-время конца.')
+        parser.add_argument('--group', help='Слаг группы.')
+        parser.add_argument('--author', help='Имя автора.')
+        parser.add_argument(
+            '--after',
+            help="Водяной знак '<дата-время>,<id>' последней выгруженной "
+                 'записи: выгрузка продолжится после неё.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=EXPORT_BATCH_SIZE,
+        )
+        parser.add_argument('-o', '--output', help='Файл вместо stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_filters(options)
+        except ValueError as error:
+            raise CommandError(error)
+        lines = export_lines(
+            options['type'], options['format'],
+            batch_size=options['batch_size'], **filters
+        )
+        if options['output']:
+            with open(
+                options['output'], 'w', encoding='utf-8', newline=''
+            ) as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
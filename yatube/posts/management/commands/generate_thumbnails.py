@@ -0,0 +1,37 @@
+import os
+from multiprocessing import Pool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры всех настроенных размеров для картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов (по умолчанию — по числу ядер).',
+        )
+        parser.add_argument('--chunk-size', type=int, default=16)
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        names = list(names.iterator())
+        # Дочерние процессы открывают свои соединения с БД.
+        connections.close_all()
+        done = 0
+        with Pool(options['workers'], initializer=django.setup) as pool:
+            for _ in pool.imap_unordered(
+                generate_thumbnails, names, options['chunk_size']
+            ):
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(names)}')
+        self.stdout.write(self.style.SUCCESS(f'Обработано картинок: {done}'))
@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from posts.importer import (
+    IMPORT_CHUNK_SIZE, RECORD_TYPES, BulkImporter, read_records
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из NDJSON или CSV '
+        'пачками через bulk_create. Прерванный импорт продолжается с '
+        'последней записанной пачки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл или '-' для stdin.")
+        parser.add_argument('--format', choices=('ndjson', 'csv'))
+        parser.add_argument(
+            '--type', choices=RECORD_TYPES,
+            help='Тип записей для файлов без поля type.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+            help='Записей в одной транзакции.',
+        )
+        parser.add_argument(
+            '--create-users', action='store_true',
+            help='Создавать неизвестных авторов без пароля.',
+        )
+        parser.add_argument(
+            '--state',
+            help='Файл с номером последней записанной записи '
+                 '(по умолчанию <path>.progress).',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, не глядя на сохранённый прогресс.',
+        )
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help='Не пересобирать ленты, счётчики и хэштеги после импорта.',
+        )
+
+    def _read_state(self, state):
+        if not state or not os.path.exists(state):
+            return 0
+        with open(state) as file:
+            return int(file.read() or 0)
+
+    def _write_state(self, state, done):
+        if state:
+            with open(state + '.tmp', 'w') as file:
+                file.write(str(done))
+            os.replace(state + '.tmp', state)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'csv' if path.endswith('.csv') else 'ndjson'
+        )
+        state = options['state'] or (
+            None if path == '-' else path + '.progress'
+        )
+        skip = 0 if options['restart'] else self._read_state(state)
+        stream = sys.stdin if path == '-' else open(
+            path, newline='' if fmt == 'csv' else None, encoding='utf-8'
+        )
+        importer = BulkImporter(options['create_users'])
+        done = skip
+        started = time.monotonic()
+        try:
+            records = read_records(stream, fmt, options['type'])
+            if skip:
+                self.stdout.write(f'Пропуск уже загруженных: {skip}')
+                importer.track(islice(records, skip))
+            while True:
+                chunk = list(islice(records, options['chunk_size']))
+                if not chunk:
+                    break
+                importer.write_chunk(chunk)
+                done += len(chunk)
+                self._write_state(state, done)
+                rate = (done - skip) / (time.monotonic() - started)
+                self.stdout.write(f'Записано: {done} ({rate:.0f} записей/с)')
+        except (IntegrityError, KeyError, ValueError) as error:
+            raise CommandError(
+                f'Ошибка в пачке после записи {done}: {error!r}. '
+                'Исправьте данные и запустите команду снова.'
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        if not options['skip_rebuild']:
+            self.stdout.write('Пересборка лент, счётчиков и хэштегов...')
+            importer.finish()
+        if state and os.path.exists(state):
+            os.remove(state)
+        self.stdout.write(self.style.SUCCESS(f'Импортировано записей: {done}'))
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.follow_feed import FEED_BATCH_SIZE, rebuild_feeds
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок из Follow и Post.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересобрать ленты только этих пользователей.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=FEED_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        rebuilt = rebuild_feeds(users, options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересобрано подписок: {rebuilt}')
+        )
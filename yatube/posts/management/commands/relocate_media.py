@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.media import MEDIA_BATCH_SIZE, relocate_images
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в раскладку по хэшу содержимого '
+        'и переписывает ссылки на них в БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=MEDIA_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        moved = relocate_images(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Перенесено файлов: {moved}'))
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import re
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as thumbnail_delete
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from . import page_cache
+from .models import Post
+from .storage import HASH_NAME_PATTERN
+from .thumbnails import get_raw_many
+
+logger = logging.getLogger(__name__)
+
+MEDIA_BATCH_SIZE = 500
+MEDIA_GC_MIN_AGE = 60 * 60 * 24
+
+
+def _legacy_names(batch_size):
+    """Имена картинок в старой плоской раскладке, пачками по алфавиту."""
+    names = Post.objects.exclude(image='').exclude(
+        image__regex=HASH_NAME_PATTERN
+    ).order_by('image').values_list('image', flat=True).distinct()
+    last = ''
+    while True:
+        batch = list(names.filter(image__gt=last)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def relocate_images(batch_size=MEDIA_BATCH_SIZE, storage=None):
+    """Переносит картинки постов в хранилище с адресацией по содержимому.
+
+    На пачку имён столбец image переписывается одним UPDATE с CASE, старые
+    файлы удаляются только после фиксации транзакции. Возвращает число
+    перенесённых файлов.
+    """
+    storage = storage or Post._meta.get_field('image').storage
+    moved = 0
+    for batch in _legacy_names(batch_size):
+        renames = {}
+        for name in batch:
+            if not storage.exists(name):
+                logger.warning('Файл %s не найден, пропущен', name)
+                continue
+            with storage.open(name) as content:
+                renames[name] = storage.save(name, content)
+        if not renames:
+            continue
+        posts = Post.objects.filter(image__in=list(renames))
+        scopes = set()
+        for post in posts.select_related('author', 'group'):
+            scopes.update(page_cache.post_scopes(post))
+        with transaction.atomic():
+            posts.update(
+                image=Case(
+                    *(When(image=old, then=Value(new))
+                      for old, new in renames.items()),
+                    output_field=CharField(),
+                ),
+                updated=timezone.now(),
+            )
+        page_cache.bump_versions(*scopes)
+        for old, new in renames.items():
+            if old != new:
+                # Вместе с файлом — его миниатюры и записи kvstore sorl:
+                # иначе сборщик мусора считал бы миниатюры живыми.
+                thumbnail_delete(ImageFile(old, storage))
+        moved += len(renames)
+    return moved
+
+
+def _walk(storage, directory, cutoff, exclude=()):
+    """Файлы под directory старше cutoff, по одному, через os.scandir.
+
+    В памяти держится только текущая запись каждого уровня, поэтому обход
+    не зависит от числа файлов в каталоге.
+    """
+    try:
+        entries = os.scandir(storage.path(directory))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f'{directory}/{entry.name}'
+            if entry.is_dir(follow_symlinks=False):
+                if name not in exclude:
+                    yield from _walk(storage, name, cutoff, exclude)
+            elif entry.stat().st_mtime < cutoff:
+                yield name
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def orphaned_images(storage, cutoff, batch_size=MEDIA_BATCH_SIZE):
+    """Оригиналы, на которые не ссылается ни один пост.
+
+    Каталог адаптивных вариантов пропускается: ссылки на них лежат
+    в JSON, их собирает orphaned_variants.
+    """
+    root = Post._meta.get_field('image').upload_to.rstrip('/')
+    exclude = {settings.IMAGE_VARIANT_DIR.rstrip('/')}
+    for batch in _chunks(_walk(storage, root, cutoff, exclude), batch_size):
+        referenced = set(Post.objects.filter(image__in=batch).values_list(
+            'image', flat=True
+        ))
+        yield from (name for name in batch if name not in referenced)
+
+
+def referenced_variants(names):
+    """Те из names, что упомянуты в манифесте хотя бы одного поста."""
+    names = set(names)
+    if not names:
+        return set()
+    pattern = '"({})"'.format('|'.join(map(re.escape, sorted(names))))
+    manifests = Post.objects.filter(
+        image_variants__regex=pattern
+    ).values_list('image_variants', flat=True)
+    referenced = set()
+    for manifest in manifests.iterator():
+        for ladder in json.loads(manifest).values():
+            referenced.update(name for _, name in ladder)
+    return referenced & names
+
+
+def orphaned_variants(storage, cutoff, batch_size=MEDIA_BATCH_SIZE):
+    """Адаптивные варианты, которых нет ни в одном манифесте постов."""
+    root = settings.IMAGE_VARIANT_DIR.rstrip('/')
+    for batch in _chunks(_walk(storage, root, cutoff), batch_size):
+        referenced = referenced_variants(batch)
+        yield from (name for name in batch if name not in referenced)
+
+
+def orphaned_thumbnails(cutoff, batch_size=MEDIA_BATCH_SIZE):
+    """Файлы миниатюр, о которых не знает kvstore sorl."""
+    root = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+    files = _walk(default.storage, root, cutoff)
+    for batch in _chunks(files, batch_size):
+        keys = {
+            name: add_prefix(ImageFile(name, default.storage).key)
+            for name in batch
+        }
+        known = get_raw_many(list(keys.values()))
+        yield from (name for name in batch if not known.get(keys[name]))
+
+
+def collect_garbage(min_age=MEDIA_GC_MIN_AGE, dry_run=False,
+                    batch_size=MEDIA_BATCH_SIZE):
+    """Удаляет картинки без постов вместе с их миниатюрами.
+
+    Отдаёт имена удалённых (при dry_run — подлежащих удалению) файлов.
+    Файлы моложе min_age секунд не трогаются: пост с только что
+    загруженной картинкой мог ещё не быть сохранён. Повторная загрузка
+    того же содержимого не обновляет mtime старого файла, поэтому ссылки
+    перепроверяются прямо перед удалением.
+    """
+    storage = Post._meta.get_field('image').storage
+    cutoff = time.time() - min_age
+    for name in orphaned_images(storage, cutoff, batch_size):
+        if not dry_run:
+            if Post.objects.filter(image=name).exists():
+                continue
+            thumbnail_delete(ImageFile(name, storage))
+        yield name
+    for name in orphaned_variants(storage, cutoff, batch_size):
+        if not dry_run:
+            if referenced_variants([name]):
+                continue
+            storage.delete(name)
+        yield name
+    for name in orphaned_thumbnails(cutoff, batch_size):
+        if not dry_run:
+            default.storage.delete(name)
+        yield name
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def seed_user_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    users = User.objects.filter(stats__isnull=True).annotate(
+        posts_total=_count(Post, 'author'),
+        followers_total=_count(Follow, 'author'),
+        following_total=_count(Follow, 'user'),
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(users.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        UserStats.objects.bulk_create(
+            UserStats(
+                user_id=user.pk,
+                posts_count=user.posts_total,
+                followers_count=user.followers_total,
+                following_count=user.following_total,
+            )
+            for user in batch
+        )
+        last_pk = batch[-1].pk
+
+
+def seed_comments_count(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    posts = Post.objects.only('pk', 'comments_count').annotate(
+        comments_total=_count(Comment, 'post')
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        drifted = [
+            post for post in batch
+            if post.comments_count != post.comments_total
+        ]
+        for post in drifted:
+            post.comments_count = post.comments_total
+        Post.objects.bulk_update(drifted, ['comments_count'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0025_comment_created_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_user_stats, migrations.RunPython.noop),
+        migrations.RunPython(seed_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+from itertools import islice
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def backfill_feed_entries(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedEntry = apps.get_model('posts', 'FeedEntry')
+    follows = Follow.objects.order_by('pk').values_list(
+        'pk', 'user_id', 'author_id'
+    )
+    last_pk = 0
+    while True:
+        batch = list(follows.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        for _, user_id, author_id in batch:
+            posts = Post.objects.filter(author_id=author_id).values_list(
+                'pk', 'pub_date'
+            ).iterator(chunk_size=BATCH_SIZE)
+            while True:
+                chunk = list(islice(posts, BATCH_SIZE))
+                if not chunk:
+                    break
+                FeedEntry.objects.bulk_create(
+                    [
+                        FeedEntry(
+                            user_id=user_id,
+                            post_id=post_id,
+                            author_id=author_id,
+                            pub_date=pub_date,
+                        )
+                        for post_id, pub_date in chunk
+                    ],
+                    ignore_conflicts=True,
+                )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0026_seed_user_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feed_entries, migrations.RunPython.noop),
+    ]
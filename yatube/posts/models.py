@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
 
@@ -34,6 +36,11 @@ class Post(models.Model):
         verbose_name='publication of date',
         help_text='Дата публикации',
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='last modified',
+        help_text='Дата последнего изменения',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -52,13 +59,41 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=post_image_storage,
+        blank=True,
+        db_index=True,
+    )
+    image_variants = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        help_text='JSON: адаптивные варианты картинки по форматам',
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Comments count',
+        help_text='Число комментариев',
     )
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                name='post_date_idx',
+                fields=['-pub_date', '-id'],
+            ),
+            models.Index(
+                name='post_author_date_idx',
+                fields=['author', '-pub_date', '-id'],
+            ),
+            models.Index(
+                name='post_group_date_idx',
+                fields=['group', '-pub_date', '-id'],
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
@@ -89,6 +124,16 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                name='comment_post_created_idx',
+                fields=['post', '-created', '-id'],
+            ),
+            models.Index(
+                name='comment_created_idx',
+                fields=['-created', '-id'],
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -110,3 +155,98 @@ class Follow(models.Model):
                 fields=['user', 'author'],
             ),
         ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, поддерживаемые при записи."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class FeedEntry(models.Model):
+    """Материализованная лента подписок: запись на каждый пост автора."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                name='feed_entry_user_post_unique',
+                fields=['user', 'post'],
+            ),
+        ]
+        indexes = [
+            models.Index(
+                name='feed_entry_user_date_idx',
+                fields=['user', '-pub_date', '-post'],
+            ),
+            models.Index(
+                name='feed_entry_user_author_idx',
+                fields=['user', 'author'],
+            ),
+        ]
+
+
+class Tag(models.Model):
+    """Хэштег из текста поста, в нижнем регистре и без '#'."""
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Tag',
+        help_text='Хэштег',
+    )
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """Пост с хэштегом; pub_date копируется для индекса ленты тега."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name='post_tags',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        constraints = [
+            models.UniqueConstraint(
+                name='post_tag_post_tag_unique',
+                fields=['post', 'tag'],
+            ),
+        ]
+        indexes = [
+            models.Index(
+                name='post_tag_tag_date_idx',
+                fields=['tag', '-pub_date', '-post'],
+            ),
+        ]
@@ -0,0 +1,123 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'feed-version:{}'
+PAGE_KEY = 'feed-page:{}'
+
+
+def post_scopes(post):
+    """Ленты, на которых виден пост: общая, группы и автора."""
+    scopes = ['index', author_scope(post.author.username)]
+    if post.group_id is not None:
+        scopes.append(group_scope(post.group.slug))
+    return scopes
+
+
+def post_tag_scopes(post):
+    return [
+        tag_scope(name)
+        for name in post.post_tags.values_list('tag__name', flat=True)
+    ]
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def tag_scope(name):
+    return f'tag:{name}'
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def get_versions(scopes):
+    """Текущие версии лент.
+
+    Версия — случайный токен, а не счётчик: если ключ вытеснен из кэша,
+    лента получает новый токен, и страницы и ETag, собранные под прежней
+    версией, уже не совпадут. Если кэш не сохранил токен, возвращается
+    одноразовый, который не совпадёт ни с чем.
+    """
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _new_version(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) or _new_version() for key in keys]
+
+
+def bump_versions(*scopes):
+    """Инвалидирует все страницы лент, переводя их на новое поколение."""
+    cache.set_many(
+        {VERSION_KEY.format(scope): _new_version() for scope in scopes},
+        timeout=None,
+    )
+
+
+def request_etag(request, *parts):
+    """ETag страницы: адрес, пользователь и всё, от чего зависит ответ.
+
+    Cookie CSRF входит в ETag, потому что в формах страницы лежит
+    токен: после нового входа браузер не должен получить 304 со старым.
+    """
+    raw = '|'.join([
+        request.get_full_path(),
+        str(request.user.pk),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *map(str, parts),
+    ])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def feed_etag(scopes_func):
+    """ETag ленты из версий её кэша — без запросов к БД.
+
+    Функция подходит для etag_func декоратора condition.
+    """
+    def etag(request, *args, **kwargs):
+        scopes = scopes_func(**kwargs)
+        return request_etag(request, *(
+            f'{s}={v}' for s, v in zip(scopes, get_versions(scopes))
+        ))
+    return etag
+
+
+def cache_feed(scopes_func):
+    """Кэширует GET-страницу ленты под ключом текущих версий её лент.
+
+    scopes_func получает kwargs представления и возвращает список лент.
+    Страница живёт FEED_CACHE_TIMEOUT секунд, но после записи в ленту
+    её версия меняется, и следующий запрос собирает страницу заново.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            scopes = scopes_func(**kwargs)
+            raw_key = '|'.join([
+                request.get_full_path(),
+                str(request.user.pk),
+                *(f'{s}={v}' for s, v in zip(scopes, get_versions(scopes))),
+            ])
+            key = PAGE_KEY.format(hashlib.md5(raw_key.encode()).hexdigest())
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response, settings.FEED_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+import re
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .utils import CursorPaginator, paginate_page
+
+FTS_TABLE = 'posts_post_fts'
+SNIPPET_TOKENS = 16
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+# Таблица FTS5 хранит только индекс, текст берётся из posts_post по rowid.
+# Триггеры держат её в синхронности при любых записях, включая
+# bulk_create и QuerySet.update().
+FTS_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON posts_post
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def install_triggers(using=None):
+    """Создаёт триггеры индекса, если их нет.
+
+    SQLite пересоздаёт таблицу при изменении схемы в миграциях и теряет
+    её триггеры, поэтому они восстанавливаются после каждого migrate.
+    """
+    conn = connections[using] if using else connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        if FTS_TABLE not in conn.introspection.table_names(cursor):
+            return
+        for sql in FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def match_expression(query):
+    """Запрос пользователя в безопасное выражение MATCH.
+
+    Слова берутся в кавычки, чтобы операторы FTS5 в тексте запроса
+    не давали синтаксических ошибок; последнее слово ищется по префиксу.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids(query):
+    """Подзапрос id постов, подходящих под запрос, по индексу FTS5."""
+    return RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_expression(query)],
+    )
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(_MARK_START, '<mark>')
+        .replace(_MARK_END, '</mark>')
+    )
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация результатов FTS5 по (релевантность, id).
+
+    Релевантность — bm25 со знаком минус, чтобы лучшие результаты шли
+    первыми при той же сортировке по убыванию, что и у лент.
+    """
+    value_type = float
+
+    def __init__(self, query, per_page):
+        super().__init__(Post.objects.none(), per_page, ('score', 'id'))
+        self.match = match_expression(query)
+
+    def fetch(self, position, backward, limit):
+        order, compare = ('ASC', '>') if backward else ('DESC', '<')
+        where, params = '', [self.match]
+        if position is not None:
+            where = (
+                f'WHERE score {compare} %s '
+                f'OR (score = %s AND id {compare} %s)'
+            )
+            score, pk = position
+            params += [score, score, pk]
+        sql = f"""
+            SELECT id, score, snippet FROM (
+                SELECT rowid AS id, -bm25({FTS_TABLE}) AS score,
+                       snippet({FTS_TABLE}, 0, %s, %s, '…', %s) AS snippet
+                FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+            ) {where}
+            ORDER BY score {order}, id {order}
+            LIMIT %s
+        """
+        params = [_MARK_START, _MARK_END, SNIPPET_TOKENS] + params + [limit]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for pk, _, _ in rows]
+        )
+        result = []
+        for pk, score, snippet in rows:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.score = score
+            post.snippet = highlight(snippet)
+            result.append(post)
+        return result
+
+
+def search_page(request, query, per_page=10):
+    if not match_expression(query):
+        return None
+    if not fts_enabled():
+        return paginate_page(
+            request,
+            Post.objects.select_related('author', 'group').filter(
+                text__icontains=query
+            ),
+            per_page,
+        )
+    paginator = SearchPaginator(query, per_page)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -0,0 +1,207 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+
+from . import autocomplete, counters, follow_feed, page_cache, search, tags
+from .models import Comment, Follow, Group, Post, PostTag
+
+User = get_user_model()
+
+# Поля пользователя, которые видны на карточках постов.
+SHOWN_USER_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def _feeds_showing(posts):
+    """Все ленты, где видны посты, — при смене имени автора или группы."""
+    posts = posts.order_by()
+    scopes = {'index'}
+    scopes.update(map(page_cache.author_scope, posts.values_list(
+        'author__username', flat=True
+    ).distinct()))
+    scopes.update(map(page_cache.group_scope, posts.exclude(
+        group=None
+    ).values_list('group__slug', flat=True).distinct()))
+    scopes.update(map(page_cache.tag_scope, PostTag.objects.filter(
+        post__in=posts
+    ).order_by().values_list('tag__name', flat=True).distinct()))
+    return scopes
+
+
+@receiver(pre_save, sender=Post)
+def on_post_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._previous_group_slug = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group__slug', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def on_post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        follow_feed.fan_out_post(instance)
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+    scopes = page_cache.post_scopes(instance)
+    scopes += map(page_cache.tag_scope, tags.index_posts([instance]))
+    previous_group_slug = getattr(instance, '_previous_group_slug', None)
+    if previous_group_slug is not None:
+        scopes.append(page_cache.group_scope(previous_group_slug))
+    page_cache.bump_versions(*scopes)
+
+
+@receiver(pre_delete, sender=Post)
+def on_post_deleting(sender, instance, **kwargs):
+    # Связи с тегами удаляются каскадом раньше поста, поэтому ленты,
+    # на которых он виден, собираются до удаления.
+    instance._feed_scopes = (
+        page_cache.post_scopes(instance)
+        + page_cache.post_tag_scopes(instance)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def on_post_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    page_cache.bump_versions(*getattr(instance, '_feed_scopes', ()))
+
+
+@receiver(post_save, sender=Comment)
+def on_comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def on_comment_deleted(sender, instance, **kwargs):
+    counters.change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def on_follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follow_feed.backfill_feed(instance.user_id, instance.author_id)
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        page_cache.bump_versions(
+            page_cache.author_scope(instance.author.username),
+            page_cache.author_scope(instance.user.username),
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def on_follow_deleted(sender, instance, **kwargs):
+    follow_feed.prune_feed(instance.user_id, instance.author_id)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    page_cache.bump_versions(
+        page_cache.author_scope(instance.author.username),
+        page_cache.author_scope(instance.user.username),
+    )
+
+
+@receiver(post_migrate)
+def on_migrated(sender, using, **kwargs):
+    if sender.name == 'posts':
+        search.install_triggers(using)
+
+
+@receiver(pre_save, sender=User)
+def on_user_saving(sender, instance, raw=False, update_fields=None,
+                   **kwargs):
+    if raw or instance.pk is None:
+        return
+    # Вход в систему сохраняет только last_login — имя не читаем.
+    if update_fields is not None and not set(update_fields) & set(
+        SHOWN_USER_FIELDS
+    ):
+        return
+    instance._previous_names = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*SHOWN_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def on_user_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        autocomplete.record(
+            'users', added=autocomplete.user_entries(instance.username)
+        )
+        return
+    previous = getattr(instance, '_previous_names', None)
+    current = tuple(getattr(instance, field) for field in SHOWN_USER_FIELDS)
+    if previous is None or previous == current:
+        return
+    username = previous[0]
+    if username != instance.username:
+        autocomplete.record(
+            'users',
+            removed=autocomplete.user_entries(username),
+            added=autocomplete.user_entries(instance.username),
+        )
+    # Имя автора есть на карточках и страницах всех лент с его постами.
+    page_cache.bump_versions(
+        page_cache.author_scope(username),
+        page_cache.author_scope(instance.username),
+        *_feeds_showing(instance.posts.all()),
+    )
+
+
+@receiver(post_delete, sender=User)
+def on_user_deleted(sender, instance, **kwargs):
+    autocomplete.record(
+        'users', removed=autocomplete.user_entries(instance.username)
+    )
+
+
+@receiver(pre_save, sender=Group)
+def on_group_saving(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._previous_names = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', 'title').first()
+
+
+@receiver(post_save, sender=Group)
+def on_group_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_names', None)
+    current = (instance.slug, instance.title)
+    scopes = {page_cache.group_scope(instance.slug)}
+    if previous is not None:
+        scopes.add(page_cache.group_scope(previous[0]))
+        if previous != current:
+            # Название и ссылка группы есть в карточках на других лентах.
+            scopes |= _feeds_showing(instance.posts.all())
+    page_cache.bump_versions(*scopes)
+    if previous == current:
+        return
+    autocomplete.record(
+        'groups',
+        removed=autocomplete.group_entries(*previous) if previous else (),
+        added=autocomplete.group_entries(*current),
+    )
+
+
+@receiver(pre_delete, sender=Group)
+def on_group_deleting(sender, instance, **kwargs):
+    # Посты отвязываются от группы UPDATE без сигналов, поэтому ленты
+    # с их карточками собираются до удаления.
+    instance._feed_scopes = _feeds_showing(instance.posts.all())
+
+
+@receiver(post_delete, sender=Group)
+def on_group_deleted(sender, instance, **kwargs):
+    page_cache.bump_versions(
+        page_cache.group_scope(instance.slug),
+        *getattr(instance, '_feed_scopes', ()),
+    )
+    autocomplete.record(
+        'groups',
+        removed=autocomplete.group_entries(instance.slug, instance.title),
+    )
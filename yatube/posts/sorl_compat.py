@@ -0,0 +1,31 @@
+import sorl
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+
+# Единственное место, где используется внутренний API sorl-thumbnail:
+# _get_format, extra_options, _get_thumbnail_filename и _get_raw.
+# Тесты сверяют thumbnail_name с настоящим get_thumbnail и падают на
+# версии не из этого списка — перед обновлением sorl их нужно прогнать.
+TESTED_VERSIONS = ('12.7.0',)
+VERSION = sorl.__version__
+
+
+def thumbnail_name(source, geometry, options):
+    """Имя файла, под которым get_thumbnail сохранит миниатюру source."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return backend._get_thumbnail_filename(source, geometry, options)
+
+
+def get_raw(kvstore, key):
+    """Сырое значение kvstore по уже префиксованному ключу."""
+    return kvstore._get_raw(key)
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import re
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME_PATTERN = r'(^|/)([0-9a-f]{2}/){2}[0-9a-f]{64}\.[a-z0-9]+$'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под хэшем содержимого: posts/ab/cd/abcd….jpg.
+
+    Каталог из upload_to сохраняется, внутри него файлы разложены по двум
+    уровням подкаталогов из префикса sha256, так что ни в одном каталоге
+    не скапливаются сотни тысяч файлов. Одинаковые загрузки получают одно
+    имя и хранятся один раз, поэтому файл могут разделять несколько постов:
+    удалять его можно только через сборщик мусора.
+    """
+
+    def __init__(self, *args, depth=2, width=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth = depth
+        self.width = width
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        shards = [
+            digest[i * self.width:(i + 1) * self.width]
+            for i in range(self.depth)
+        ]
+        directory, basename = os.path.split(name)
+        ext = os.path.splitext(basename)[1].lower()
+        return '/'.join(filter(None, [directory, *shards, digest + ext]))
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def is_content_addressed(name):
+    return re.search(HASH_NAME_PATTERN, name) is not None
+
+
+post_image_storage = ContentAddressedStorage()
@@ -0,0 +1,94 @@
+import re
+
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+
+from .models import Post, PostTag, Tag
+from .utils import CursorPaginator
+
+TAG_BATCH_SIZE = 500
+HASHTAG_RE = re.compile(r'(?<![\w&#/])#(\w{1,100})')
+
+
+def normalize_tag(name):
+    return name.casefold()
+
+
+def extract_tags(text):
+    return {normalize_tag(name) for name in HASHTAG_RE.findall(text)}
+
+
+def _tag_ids(names):
+    """id тегов по именам; недостающие создаются одним bulk_create."""
+    if not names:
+        return {}
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in names], ignore_conflicts=True
+    )
+    return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def index_posts(posts):
+    """Пересобирает связи пост–тег для пачки постов.
+
+    Число запросов не зависит от размера пачки: теги создаются и читаются
+    разом, старые связи удаляются одним DELETE, новые — одним INSERT.
+    Возвращает имена тегов, которые были или стали у постов.
+    """
+    tags_by_post = {post.pk: extract_tags(post.text) for post in posts}
+    names = set().union(*tags_by_post.values())
+    previous = PostTag.objects.filter(post__in=list(tags_by_post)).values_list(
+        'tag__name', flat=True
+    )
+    touched = names | set(previous)
+    ids = _tag_ids(names)
+    PostTag.objects.filter(post__in=list(tags_by_post)).delete()
+    PostTag.objects.bulk_create([
+        PostTag(post_id=post.pk, tag_id=ids[name], pub_date=post.pub_date)
+        for post in posts
+        for name in tags_by_post[post.pk]
+    ])
+    return touched
+
+
+def backfill_tags(batch_size=TAG_BATCH_SIZE):
+    """Индексирует хэштеги всех постов пачками по pk; возвращает число."""
+    posts = Post.objects.only('pk', 'text', 'pub_date').order_by('pk')
+    last_pk = indexed = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return indexed
+        index_posts(batch)
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+
+
+def link_hashtags(html):
+    """Превращает #теги в уже экранированном HTML в ссылки на ленты тегов."""
+    def replace(match):
+        url = reverse('posts:tag_posts', args=[normalize_tag(match[1])])
+        return f'<a href="{url}">{match[0]}</a>'
+    return mark_safe(HASHTAG_RE.sub(replace, html))
+
+
+class TagPaginator(CursorPaginator):
+    """Курсорная пагинация ленты тега по индексу (tag, -pub_date)."""
+
+    def __init__(self, tag, per_page):
+        super().__init__(
+            PostTag.objects.filter(tag=tag).select_related(
+                'post__author', 'post__group'
+            ),
+            per_page,
+            keys=('pub_date', 'post_id'),
+        )
+
+    def fetch(self, position, backward, limit):
+        return [
+            post_tag.post
+            for post_tag in super().fetch(position, backward, limit)
+        ]
+
+    def position(self, post):
+        return post.pub_date, post.pk
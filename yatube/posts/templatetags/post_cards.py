@@ -0,0 +1,85 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .. import images, page_cache, tags, thumbnails
+
+register = template.Library()
+
+CARD_KEY = 'post-card:{}:{}:{}'
+
+
+def card_scopes(post):
+    """Версии, от которых зависит карточка помимо самого поста."""
+    scopes = [page_cache.author_scope(post.author.username)]
+    if post.group_id is not None:
+        scopes.append(page_cache.group_scope(post.group.slug))
+    return scopes
+
+
+def card_key(post, versions=None):
+    if versions is None:
+        versions = page_cache.get_versions(card_scopes(post))
+    return CARD_KEY.format(
+        post.pk, post.updated.timestamp(), ':'.join(versions)
+    )
+
+
+@register.simple_tag
+def ready_thumbnail(image, alias):
+    """Только уже созданная миниатюра; иначе None и задача в очередь."""
+    return thumbnails.ready_thumbnail(image, alias)
+
+
+@register.filter
+def image_sources(post):
+    return images.image_sources(post)
+
+
+@register.filter(is_safe=True)
+def link_hashtags(html):
+    return tags.link_hashtags(html)
+
+
+@register.simple_tag
+def post_cards(posts):
+    """HTML карточек постов: одним get_many из кэша, недостающие рендерит.
+
+    Ключ включает время изменения поста и версии автора и группы,
+    поэтому правка поста, переименование автора или группы выводят
+    старую карточку из оборота. Версии всех карточек читаются одним
+    get_many. Миниатюры недостающих карточек ищутся в kvstore sorl
+    тоже одним пакетом. Карточка, чья миниатюра
+    ещё не готова, не кэшируется, чтобы не закрепить запасную картинку.
+    """
+    scopes = {post.pk: card_scopes(post) for post in posts}
+    unique = list({scope for names in scopes.values() for scope in names})
+    versions = dict(zip(unique, page_cache.get_versions(unique)))
+    keys = [
+        card_key(post, [versions[scope] for scope in scopes[post.pk]])
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    missing = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    ready = thumbnails.ready_thumbnails(
+        [post.image for _, post in missing], 'card'
+    )
+    rendered = {}
+    for (key, post), thumbnail in zip(missing, ready):
+        cards[key] = render_to_string(
+            'includes/post_card.html',
+            {
+                'post': post,
+                'thumbnail': thumbnail,
+                'sizes': settings.IMAGE_VARIANT_SIZES,
+            },
+        )
+        if thumbnail is not None or not post.image:
+            rendered[key] = cards[key]
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return [mark_safe(cards[key]) for key in keys]
@@ -1,21 +1,40 @@
+import hashlib
+import json
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
 
-from ..models import Follow, Group, Post
+from .. import sorl_compat
+from ..media import collect_garbage
+from ..models import FeedEntry, Follow, Group, Post
+from ..templatetags.post_cards import card_key
+from ..thumbnails import (
+    generate_thumbnails, queue_thumbnails, ready_thumbnail,
+    schedule_thumbnails, thumbnail_file,
+)
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 User = get_user_model()
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0
+)
 class ViewTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -66,8 +85,9 @@ class ViewTests(TestCase):
     def test_sorl_thumbnail_index(self):
         """Пост с картинкой передаётся в словаре context (profile)"""
         response = self.guest_client.get(reverse('posts:index'))
-        self.assertIn(
-            self.uploaded.name, response.context['page_obj'][0].image.name
+        self.assertEqual(
+            self.post_with_img.image.name,
+            response.context['page_obj'][0].image.name,
         )
 
     def test_sorl_thumbnail_profile(self):
@@ -77,8 +97,9 @@ class ViewTests(TestCase):
                 'posts:profile', kwargs={'username': self.user_author.username}
             )
         )
-        self.assertIn(
-            self.uploaded.name, response.context['page_obj'][0].image.name
+        self.assertEqual(
+            self.post_with_img.image.name,
+            response.context['page_obj'][0].image.name,
         )
 
     def test_sorl_thumbnail_group(self):
@@ -86,8 +107,9 @@ class ViewTests(TestCase):
         response = self.guest_client.get(
             reverse('posts:group_list', kwargs={'slug': self.group_test.slug})
         )
-        self.assertIn(
-            self.uploaded.name, response.context['page_obj'][0].image.name
+        self.assertEqual(
+            self.post_with_img.image.name,
+            response.context['page_obj'][0].image.name,
         )
 
     def test_sorl_thumbnail_post_detail(self):
@@ -97,8 +119,9 @@ class ViewTests(TestCase):
                 'posts:post_detail', kwargs={'post_id': self.post_with_img.pk}
             )
         )
-        self.assertIn(
-            self.uploaded.name, response.context['post'].image.name
+        self.assertEqual(
+            self.post_with_img.image.name,
+            response.context['post'].image.name,
         )
 
     def test_sorl_thumbnail_PostForm(self):
@@ -121,7 +144,8 @@ class ViewTests(TestCase):
             author=self.user_author,
         )
         response = self.guest_client.get(reverse('posts:index'))
-        test_post_cache.delete()
+        # update() минует сигналы, поэтому страница остаётся в кэше.
+        Post.objects.filter(pk=test_post_cache.pk).update(text='Другой')
         response_cache = self.guest_client.get(reverse('posts:index'))
 
         self.assertEqual(response.content, response_cache.content)
@@ -130,6 +154,62 @@ class ViewTests(TestCase):
         response_cache = self.guest_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_cache.content)
 
+    def test_delete_invalidates_feeds(self):
+        """Удалённый пост сразу пропадает с главной, ленты тега и профиля."""
+        post = Post.objects.create(
+            text='Пост на удаление #удаление', author=self.user_author,
+        )
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:tag_posts', kwargs={'name': 'удаление'}),
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.user_author.username},
+            ),
+        ]
+        for url in urls:
+            self.assertContains(self.guest_client.get(url), 'Пост на удаление')
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.guest_client.get(url), 'Пост на удаление'
+                )
+
+    def test_group_edit_invalidates_group_page(self):
+        url = reverse(
+            'posts:group_list', kwargs={'slug': self.group_test.slug}
+        )
+        self.guest_client.get(url)
+        group = Group.objects.get(pk=self.group_test.pk)
+        group.description = 'Новое описание группы'
+        group.save()
+        self.assertContains(self.guest_client.get(url), 'Новое описание')
+
+    def test_group_delete_invalidates_feeds(self):
+        """После удаления группы ленты не ссылаются на неё из кэша."""
+        group = Group.objects.create(title='Временная', slug='temporary')
+        Post.objects.create(
+            text='Пост временной группы', author=self.user_author,
+            group=group,
+        )
+        group_url = reverse('posts:group_list', kwargs={'slug': 'temporary'})
+        urls = [
+            reverse('posts:index'),
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.user_author.username},
+            ),
+        ]
+        for url in urls:
+            self.assertContains(self.guest_client.get(url), group_url)
+        group.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Пост временной группы')
+                self.assertNotContains(response, group_url)
+
     def test_404(self):
         """404 отдаёт кастомный шаблон."""
         response = self.guest_client.get('/nothingpage')
@@ -178,3 +258,361 @@ class ViewTests(TestCase):
         test_follow.delete()
         response = self.commentator_client.get(reverse('posts:follow_index'))
         self.assertNotContains(response, test_post_follow.text)
+
+    def test_follow_feed_materialized(self):
+        """Лента подписок наполняется при публикации и чистится
+        при отписке, а rebuild_feeds восстанавливает её с нуля."""
+        Follow.objects.create(
+            user=self.user_commentator, author=self.user_author
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_commentator, post=self.post_with_img
+        ).exists())
+        new_post = Post.objects.create(
+            text='Новый пост в ленту', author=self.user_author
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_commentator, post=new_post
+        ).exists())
+
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        response = self.commentator_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post_with_img]
+        )
+
+    def test_failed_rebuild_keeps_feed(self):
+        """Сбой при пересборке откатывает очистку ленты."""
+        Follow.objects.create(
+            user=self.user_commentator, author=self.user_author
+        )
+        with mock.patch(
+            'posts.follow_feed.backfill_feed', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                call_command('rebuild_feeds', stdout=StringIO())
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_commentator, post=self.post_with_img
+        ).exists())
+
+        self.commentator_client.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.user_author.username}
+            )
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.user_commentator).exists()
+        )
+
+    def test_follow_feed_strategies_agree(self):
+        """Все стратегии ленты подписок отдают одинаковые страницы."""
+        authors = [
+            User.objects.create_user(username=f'FeedAuthor{i}')
+            for i in range(3)
+        ]
+        for i in range(25):
+            Post.objects.create(text=f'Пост {i}', author=authors[i % 3])
+        for author in authors[:2]:
+            Follow.objects.create(user=self.user_commentator, author=author)
+
+        pages = {}
+        for strategy in ('join', 'materialized', 'merge'):
+            pages[strategy] = []
+            url = reverse('posts:follow_index') + f'?feed={strategy}'
+            while url:
+                response = self.commentator_client.get(url)
+                page_obj = response.context['page_obj']
+                pages[strategy].append([post.pk for post in page_obj])
+                url = page_obj.has_next() and (
+                    reverse('posts:follow_index')
+                    + f'?feed={strategy}&cursor={page_obj.next_cursor}'
+                )
+        self.assertEqual(pages['join'], pages['materialized'])
+        self.assertEqual(pages['join'], pages['merge'])
+        self.assertEqual(sum(map(len, pages['merge'])), 17)
+
+    def test_versioned_cache_invalidated_on_write(self):
+        """Закэшированные ленты обновляются сразу после записи поста."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group_test.slug}),
+            reverse(
+                'posts:profile', kwargs={'username': self.user_author.username}
+            ),
+        ]
+        for url in urls:
+            self.guest_client.get(url)
+        self.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Свежий пост', 'group': self.group_test.pk},
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Свежий пост')
+
+        post = Post.objects.get(text='Свежий пост')
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Отредактированный пост'},
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                if url == urls[1]:
+                    self.assertNotContains(response, 'Отредактированный')
+                else:
+                    self.assertContains(response, 'Отредактированный')
+
+    def test_post_card_fragment_cache(self):
+        """Карточки постов берутся из кэша и обновляются после правки."""
+        post = Post.objects.create(
+            text='Пост с карточкой', author=self.user_author
+        )
+        cache.set(card_key(post), '<article>из кэша</article>')
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'из кэша')
+        self.assertIsNone(cache.get(card_key(self.post_with_img)))
+
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Исправленная карточка'},
+        )
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленная карточка')
+        self.assertNotContains(response, 'из кэша')
+
+    def test_post_card_follows_author_and_group(self):
+        """Смена имени автора или названия группы обновляет карточку."""
+        post = Post.objects.create(
+            text='Карточка группы', author=self.user_author,
+            group=self.group_test,
+        )
+        cache.set(card_key(post), '<article>из кэша</article>')
+        author = User.objects.get(pk=self.user_author.pk)
+        author.first_name = 'Новое имя'
+        author.save()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'из кэша')
+        self.assertContains(response, 'Новое имя')
+
+        cache.set(
+            card_key(Post.objects.get(pk=post.pk)),
+            '<article>из кэша</article>',
+        )
+        group = Group.objects.get(pk=self.group_test.pk)
+        group.slug = 'new-slug'
+        group.save()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'из кэша')
+        self.assertContains(response, '/group/new-slug/')
+
+    def test_pregenerated_thumbnail_served(self):
+        """Шаблоны отдают только готовые миниатюры, созданные заранее."""
+        image = self.post_with_img.image
+        self.assertIsNone(ready_thumbnail(image, 'card'))
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, image.url)
+
+        generate_thumbnails(image.name)
+        thumbnail = ready_thumbnail(image, 'card')
+        self.assertIsNotNone(thumbnail)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail.url)
+        self.post_with_img.refresh_from_db()
+        self.assertIn(
+            thumbnail.url, cache.get(card_key(self.post_with_img))
+        )
+
+    def test_sorl_private_api_matches(self):
+        """Адаптер к sorl проверен на этой версии и совпадает с ней."""
+        self.assertIn(sorl_compat.VERSION, sorl_compat.TESTED_VERSIONS)
+        geometry, options = settings.THUMBNAIL_GEOMETRIES['card']
+        image = self.post_with_img.image
+        self.assertEqual(
+            get_thumbnail(image, geometry, **options).name,
+            thumbnail_file(image, 'card').name,
+        )
+
+    def test_inline_failure_is_logged(self):
+        """Пропавший исходник не роняет страницу и в режиме без пула."""
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            queue_thumbnails('posts/missing.jpg')
+
+    def test_failed_source_not_retried(self):
+        """Битый исходник не обрабатывается заново при каждой отрисовке."""
+        with mock.patch(
+            'posts.thumbnails.transaction.on_commit',
+            side_effect=lambda callback: callback(),
+        ), mock.patch(
+            'posts.thumbnails.generate_thumbnails', side_effect=OSError
+        ) as generate, self.assertLogs('posts.thumbnails', 'ERROR'):
+            for _ in range(3):
+                schedule_thumbnails('posts/broken.jpg')
+        self.assertEqual(generate.call_count, 1)
+
+    def test_responsive_variants(self):
+        """Для картинки создаётся лестница WebP с хэшем в имени и srcset."""
+        generate_thumbnails(self.post_with_img.image.name)
+        self.post_with_img.refresh_from_db()
+        variants = json.loads(self.post_with_img.image_variants)
+        storage = self.post_with_img.image.storage
+        widths = [width for width, _ in variants['image/webp']]
+        self.assertEqual(widths, list(settings.IMAGE_VARIANT_WIDTHS))
+        for _, name in variants['image/webp']:
+            with storage.open(name) as variant:
+                digest = hashlib.sha256(variant.read()).hexdigest()
+            self.assertIn(digest[:20], name)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(
+            response, storage.url(variants['image/webp'][0][1]) + ' 320w'
+        )
+        response = self.guest_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post_with_img.pk}
+        ))
+        self.assertContains(
+            response, f'sizes="{settings.IMAGE_VARIANT_SIZES}"'
+        )
+
+    def test_thumbnail_lookups_batched(self):
+        """Миниатюры страницы ищутся в kvstore одним запросом."""
+        for i in range(5):
+            Post.objects.create(
+                text=f'Пост с картинкой {i}',
+                author=self.user_author,
+                image=SimpleUploadedFile(
+                    name=f'small_{i}.gif',
+                    content=self.image,
+                    content_type='image/gif',
+                ),
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+
+    def test_identical_uploads_share_sharded_file(self):
+        """Картинка лежит под хэшем содержимого и хранится один раз."""
+        post = Post.objects.create(
+            text='Та же картинка',
+            author=self.user_commentator,
+            image=SimpleUploadedFile('copy.GIF', self.image, 'image/gif'),
+        )
+        digest = hashlib.sha256(self.image).hexdigest()
+        expected = f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        self.assertEqual(post.image.name, expected)
+        self.assertEqual(self.post_with_img.image.name, expected)
+
+    def test_relocate_media(self):
+        """relocate_media переносит старые файлы и переписывает ссылки."""
+        storage = self.post_with_img.image.storage
+        legacy = FileSystemStorage().save(
+            'posts/legacy.gif', ContentFile(self.image)
+        )
+        post = Post.objects.create(
+            text='Старая раскладка', author=self.user_author, image=legacy
+        )
+        generate_thumbnails(legacy)
+        legacy_thumbnail = ready_thumbnail(post.image, 'card')
+        self.assertTrue(legacy_thumbnail.exists())
+        call_command('relocate_media', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, self.post_with_img.image.name)
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertFalse(storage.exists(legacy))
+        self.assertFalse(legacy_thumbnail.exists())
+
+    def test_collect_media(self):
+        """collect_media удаляет картинки без постов, варианты, миниатюры."""
+        storage = self.post_with_img.image.storage
+        generate_thumbnails(self.post_with_img.image.name)
+        kept = ready_thumbnail(self.post_with_img.image, 'card')
+        kept_variants = json.loads(Post.objects.get(
+            pk=self.post_with_img.pk
+        ).image_variants)
+        orphan = Post.objects.create(
+            text='Удалённый пост',
+            author=self.user_author,
+            image=SimpleUploadedFile(
+                'other.gif', self.image.replace(b'\xFF', b'\xFE'), 'image/gif'
+            ),
+        )
+        generate_thumbnails(orphan.image.name)
+        orphan_thumbnail = ready_thumbnail(orphan.image, 'card')
+        orphan.refresh_from_db()
+        variant = json.loads(orphan.image_variants)['image/webp'][0][1]
+        name = orphan.image.name
+        orphan.delete()
+        stray = FileSystemStorage().save(
+            'cache/00/00/stray.jpg', ContentFile(b'stray')
+        )
+
+        out = StringIO()
+        call_command('collect_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn(name, out.getvalue())
+        self.assertIn(stray, out.getvalue())
+        self.assertIn(variant, out.getvalue())
+        self.assertTrue(storage.exists(name))
+
+        call_command('collect_media', min_age=0, stdout=StringIO())
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(variant))
+        for _, kept_variant in kept_variants['image/webp']:
+            self.assertTrue(storage.exists(kept_variant))
+        self.assertFalse(orphan_thumbnail.exists())
+        self.assertFalse(FileSystemStorage().exists(stray))
+        self.assertTrue(storage.exists(self.post_with_img.image.name))
+        self.assertTrue(kept.exists())
+
+    def test_collect_media_rechecks_references(self):
+        """Файл, на который сослались после обхода, не удаляется."""
+        storage = self.post_with_img.image.storage
+        name = self.post_with_img.image.name
+        with mock.patch(
+            'posts.media.orphaned_images', return_value=iter([name])
+        ):
+            removed = list(collect_garbage(min_age=0))
+        self.assertNotIn(name, removed)
+        self.assertTrue(storage.exists(name))
+
+    def test_media_view(self):
+        """Медиа отдаются с ETag, по условному GET и по диапазону."""
+        url = self.post_with_img.image.url
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.image)
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.guest_client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response['Content-Range'], f'bytes 2-5/{len(self.image)}'
+        )
+        self.assertEqual(b''.join(response.streaming_content), self.image[2:6])
+
+        response = self.guest_client.get(url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(response.status_code, 416)
+
+        self.assertEqual(
+            self.guest_client.get(settings.MEDIA_URL + '../manage.py')
+            .status_code,
+            404,
+        )
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_media_view_accel_redirect(self):
+        response = self.guest_client.get(self.post_with_img.image.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + self.post_with_img.image.name,
+        )
+        self.assertEqual(response.content, b'')
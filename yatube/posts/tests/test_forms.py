@@ -1,13 +1,22 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 
 from ..models import Post
 
 User = get_user_model()
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class FormTests(TestCase):
     @classmethod
     def setUpClass(cls) -> None:
@@ -57,3 +66,100 @@ class FormTests(TestCase):
         edit_post = Post.objects.get(pk=newpost.id)
         self.assertEqual(newpost.id, edit_post.id)
         self.assertNotEqual(newpost.text, edit_post.text)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_MAX_SIDE=150, THUMBNAIL_WORKERS=0
+)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.testuser = User.objects.create_user(username="UploadUser")
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.testuser)
+
+    @staticmethod
+    def photo(name='photo.jpg', size=(300, 200), orientation=6):
+        image = Image.new('RGB', size, (200, 10, 10))
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+    @override_settings(IMAGE_INGEST_WORKERS=1)
+    def test_upload_is_rotated_stripped_and_downscaled(self):
+        """Оригинал сохраняется повёрнутым, уменьшенным и без EXIF."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': self.photo()},
+        )
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 150))
+            self.assertFalse(image.getexif())
+
+    def test_small_upload_is_stripped(self):
+        """Метаданные убираются и у картинки, которую не нужно уменьшать."""
+        image = Image.new('RGB', (50, 40), (10, 200, 10))
+        text = PngInfo()
+        text.add_text('Location', '55.75, 37.61')
+        buffer = BytesIO()
+        image.save(buffer, 'PNG', pnginfo=text, icc_profile=b'icc')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Мелкое фото', 'image': SimpleUploadedFile(
+                'small.png', buffer.getvalue(), 'image/png'
+            )},
+        )
+        post = Post.objects.get(text='Мелкое фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (50, 40))
+            self.assertFalse(image.text)
+            self.assertEqual(image.info.get('icc_profile'), b'icc')
+
+    def test_animated_upload_is_stripped(self):
+        """Анимация сохраняет кадры, но теряет EXIF и комментарий."""
+        frames = [
+            Image.new('P', (200, 100), color) for color in (1, 2, 3)
+        ]
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        frames[0].save(
+            buffer, 'GIF', save_all=True, append_images=frames[1:],
+            duration=100, loop=0, comment=b'secret', exif=exif,
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Анимация', 'image': SimpleUploadedFile(
+                'anim.gif', buffer.getvalue(), 'image/gif'
+            )},
+        )
+        post = Post.objects.get(text='Анимация')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.n_frames, 3)
+            self.assertEqual(image.size, (150, 75))
+            self.assertNotIn('comment', image.info)
+            self.assertFalse(image.getexif())
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_upload_over_pixel_limit_is_rejected(self):
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большое фото', 'image': self.photo()},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors['image'])
+        self.assertFalse(Post.objects.filter(text='Большое фото').exists())
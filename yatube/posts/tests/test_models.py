@@ -1,11 +1,23 @@
+import json
+import os
+from importlib import import_module
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
 
-from ..models import Group, Post
+from ..models import Comment, FeedEntry, Follow, Group, Post, UserStats
+from ..page_cache import get_versions, group_scope
 
 User = get_user_model()
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class PostModelTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -42,3 +54,268 @@ class PostModelTest(TestCase):
         self.assertEqual(
             self.test_post._meta.get_field('author').help_text, 'Автор'
         )
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='CountedAuthor')
+        cls.reader = User.objects.create_user(username='CountedReader')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_counters_follow_writes(self):
+        """Счётчики постов, комментариев и подписок меняются при записи."""
+        self.reader_client.post(
+            reverse('posts:post_create'), data={'text': 'Пост читателя'}
+        )
+        post = Post.objects.get(author=self.reader)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Комментарий'},
+        )
+        self.reader_client.get(
+            reverse(
+                'posts:profile_follow', kwargs={'username': 'CountedAuthor'}
+            )
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.reader.stats.posts_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1
+        )
+
+        self.reader_client.get(
+            reverse(
+                'posts:profile_unfollow', kwargs={'username': 'CountedAuthor'}
+            )
+        )
+        post.delete()
+        stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(
+            (stats.posts_count, stats.following_count), (0, 0)
+        )
+
+    def test_reconcile_counters_repairs_drift(self):
+        """reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        post.comments.create(text='Комментарий', author=self.reader)
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+        self.reader.follower.create(author=self.author)
+        UserStats.objects.filter(user=self.reader).delete()
+
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (author_stats.posts_count, author_stats.followers_count), (1, 1)
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+
+    def test_migration_seeds_user_stats(self):
+        """Миграция создаёт счётчики пользователям, у которых их нет."""
+        Post.objects.create(text='Пост', author=self.author)
+        self.reader.follower.create(author=self.author)
+        UserStats.objects.all().delete()
+        migration = import_module('posts.migrations.0026_seed_user_stats')
+        migration.seed_user_stats(apps, None)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(
+            (author_stats.posts_count, author_stats.followers_count), (1, 1)
+        )
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+
+    def test_migration_seeds_comments_count(self):
+        """Миграция выставляет счётчики комментариев существующих постов."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        post.comments.create(text='Комментарий', author=self.reader)
+        post.comments.create(text='Ещё один', author=self.reader)
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        migration = import_module('posts.migrations.0026_seed_user_stats')
+        migration.seed_comments_count(apps, None)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+
+    def test_migration_backfills_feed_entries(self):
+        """Миграция заполняет ленты подписок из Follow и Post."""
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+            for i in range(3)
+        ]
+        self.reader.follower.create(author=self.author)
+        FeedEntry.objects.filter(post=posts[0]).delete()
+        migration = import_module(
+            'posts.migrations.0027_backfill_feed_entries'
+        )
+        migration.backfill_feed_entries(apps, None)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.reader).values_list(
+                'post_id', flat=True
+            )),
+            {post.pk for post in posts},
+        )
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ImportDataTests(TestCase):
+    RECORDS = [
+        {'type': 'group', 'slug': 'archive', 'title': 'Архив'},
+        {
+            'type': 'post', 'id': 101, 'author': 'writer', 'group': 'archive',
+            'text': 'Старый пост #архив', 'pub_date': '2015-03-01T10:00:00',
+        },
+        {
+            'type': 'post', 'id': 102, 'author': 'writer',
+            'text': 'Ещё один', 'pub_date': '2015-03-02T10:00:00',
+        },
+        {
+            'type': 'comment', 'post': 101, 'author': 'reader',
+            'text': 'Комментарий', 'created': '2015-03-03T10:00:00',
+        },
+        {'type': 'follow', 'user': 'reader', 'author': 'writer'},
+    ]
+
+    def setUp(self):
+        self.state = tempfile.NamedTemporaryFile(delete=False).name
+        self.addCleanup(
+            lambda: os.path.exists(self.state) and os.remove(self.state)
+        )
+
+    def import_records(self, records, **options):
+        stdin = StringIO('\n'.join(json.dumps(r) for r in records))
+        with mock.patch('sys.stdin', stdin):
+            call_command(
+                'import_data', '-', state=self.state, chunk_size=2,
+                stdout=StringIO(), **options
+            )
+
+    def test_import_keeps_dates_and_rebuilds_derived_data(self):
+        self.import_records(self.RECORDS, create_users=True)
+        post = Post.objects.get(pk=101)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.group.slug, 'archive')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(
+            list(post.post_tags.values_list('tag__name', flat=True)),
+            ['архив'],
+        )
+        reader = User.objects.get(username='reader')
+        self.assertEqual(
+            set(reader.feed_entries.values_list('post_id', flat=True)),
+            {101, 102},
+        )
+        self.assertEqual(post.author.stats.posts_count, 2)
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_import_rebuilds_only_affected_feeds(self):
+        bystander = User.objects.create_user(username='bystander')
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=bystander, author=other)
+        Post.objects.create(author=other, text='Чужой пост')
+        FeedEntry.objects.filter(user=bystander).delete()
+        self.import_records(self.RECORDS, create_users=True)
+        self.assertFalse(FeedEntry.objects.filter(user=bystander).exists())
+        self.assertEqual(
+            FeedEntry.objects.filter(user__username='reader').count(), 2
+        )
+
+    def test_import_resumes_after_last_chunk(self):
+        """После ошибки повторный запуск продолжает с непрочитанной пачки."""
+        User.objects.create_user(username='writer')
+        User.objects.create_user(username='reader')
+        broken = [dict(record) for record in self.RECORDS]
+        broken[3]['author'] = 'ghost'
+        with self.assertRaises(CommandError):
+            self.import_records(broken)
+        with open(self.state) as state:
+            self.assertEqual(state.read(), '2')
+        self.assertEqual(Post.objects.count(), 1)
+        group_version = get_versions([group_scope('archive')])
+
+        self.import_records(self.RECORDS)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        # Группа была только в пачке прошлого запуска.
+        self.assertNotEqual(
+            get_versions([group_scope('archive')]), group_version
+        )
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ExportDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.writer = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Архив', slug='archive')
+        for day in (3, 1, 2):
+            post = Post.objects.create(
+                author=cls.writer, text=f'Пост {day}',
+                group=cls.group if day != 2 else None,
+            )
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=post.pub_date.replace(year=2015, month=3, day=day)
+            )
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('export_data', batch_size=2, stdout=out, **options)
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_export_walks_by_date_and_resumes_from_watermark(self):
+        records = self.export()
+        self.assertEqual(
+            [record['text'] for record in records],
+            ['Пост 1', 'Пост 2', 'Пост 3'],
+        )
+        self.assertEqual(records[0]['author'], 'writer')
+        watermark = f"{records[0]['pub_date']},{records[0]['id']}"
+        self.assertEqual(self.export(after=watermark), records[1:])
+        self.assertEqual(
+            [record['text'] for record in self.export(group='archive')],
+            ['Пост 1', 'Пост 3'],
+        )
+        self.assertEqual(
+            self.export(since='2015-03-02', until='2015-03-02'),
+            records[1:2],
+        )
+        with self.assertRaises(CommandError):
+            self.export(since='вчера')
+
+    def test_csv_export_matches_import_format(self):
+        out = StringIO()
+        call_command('export_data', type='comment', format='csv', stdout=out)
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            ['id,post,author,text,created'],
+        )
+
+    def test_export_view_is_staff_only(self):
+        url = reverse('posts:export')
+        self.assertEqual(Client().get(url).status_code, 302)
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(url, {'format': 'csv', 'group': 'archive'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(
+            client.get(url, {'since': 'вчера'}).status_code, 400
+        )
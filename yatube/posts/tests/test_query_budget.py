@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+POSTS_COUNT = 12
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class QueryBudgetTests(TestCase):
+    """Число запросов на страницу не зависит от числа постов на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='BudgetReader')
+        cls.main_group = Group.objects.create(
+            title='Группа', slug='budget-group', description='Описание'
+        )
+        for i in range(POSTS_COUNT):
+            author = User.objects.create_user(username=f'BudgetAuthor{i}')
+            group = Group.objects.create(
+                title=f'Группа {i}', slug=f'budget-{i}', description='-'
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(text=f'Пост {i}', author=author, group=group)
+            Post.objects.create(
+                text=f'Пост в группе {i}', author=author, group=cls.main_group
+            )
+        cls.post = Post.objects.first()
+        cls.author = cls.post.author
+        for i in range(POSTS_COUNT):
+            commentator = User.objects.create_user(username=f'Comment{i}')
+            Comment.objects.create(
+                text=f'Комментарий {i}', post=cls.post, author=commentator
+            )
+        cls.QUERY_BUDGETS = {
+            reverse('posts:index'): 3,
+            reverse('posts:group_list', kwargs={'slug': 'budget-group'}): 4,
+            reverse(
+                'posts:profile', kwargs={'username': cls.author.username}
+            ): 6,
+            reverse('posts:follow_index') + '?feed=join': 3,
+            reverse('posts:follow_index') + '?feed=materialized': 3,
+            # Слияние читает каждого автора отдельно: O(авторов).
+            reverse('posts:follow_index') + '?feed=merge': 3 + POSTS_COUNT,
+            # Плюс запрос валидатора ETag перед отрисовкой.
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}): 6,
+        }
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def test_query_budget(self):
+        """Страницы укладываются в бюджет запросов."""
+        for url, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    '\n'.join(query['sql'] for query in queries),
+                )
+
+    def test_admin_changelists(self):
+        """Списки админки: связанные объекты одним JOIN, COUNT с LIMIT."""
+        admin = User.objects.create_superuser(
+            username='BudgetAdmin', email='admin@example.com', password='-'
+        )
+        self.client.force_login(admin)
+        budgets = {'post': 6, 'comment': 6, 'follow': 4}
+        for model, budget in budgets.items():
+            url = reverse(f'admin:posts_{model}_changelist')
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                sql = [query['sql'] for query in queries]
+                self.assertLessEqual(len(sql), budget, '\n'.join(sql))
+                for query in sql:
+                    if 'COUNT(' in query:
+                        self.assertIn('LIMIT', query)
@@ -0,0 +1,102 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..utils import encode_cursor
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN — SQLite')
+@override_settings(THUMBNAIL_WORKERS=0)
+class QueryPlanTests(TestCase):
+    """Запросы лент идут по индексам, без полного скана и сортировки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='PlanAuthor')
+        cls.reader = User.objects.create_user(username='PlanReader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='plan-group', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            Post.objects.create(
+                text=f'Пост {i} #план', author=cls.author, group=cls.group
+            )
+        cls.post = Post.objects.first()
+        cls.comment = Comment.objects.create(
+            text='Комментарий', post=cls.post, author=cls.reader
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            plan = self.explain(query['sql'])
+            with self.subTest(url=url, sql=query['sql']):
+                self.assertFalse(
+                    any('TEMP B-TREE' in step for step in plan), plan
+                )
+                self.assertFalse(
+                    any(
+                        step.startswith('SCAN') and 'INDEX' not in step
+                        for step in plan
+                    ),
+                    plan,
+                )
+
+    def test_feed_views_use_indexes(self):
+        """index, group_posts, profile, follow_index и post_detail.
+
+        Стратегия ленты 'join' не проверяется: ей сортировка нужна всегда,
+        поэтому по умолчанию используются 'materialized' и 'merge'.
+        """
+        cursor = self.client.get(
+            reverse('posts:index')
+        ).context['page_obj'].next_cursor
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:index') + f'?cursor={cursor}',
+            reverse('posts:index') + '?page=2',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+            + f'?cursor={cursor}',
+            reverse('posts:profile', kwargs={'username': 'PlanAuthor'}),
+            reverse('posts:profile', kwargs={'username': 'PlanAuthor'})
+            + f'?cursor={cursor}',
+            reverse('posts:follow_index') + '?feed=materialized',
+            reverse('posts:follow_index')
+            + f'?feed=materialized&cursor={cursor}',
+            reverse('posts:follow_index') + '?feed=merge',
+            reverse('posts:follow_index') + f'?feed=merge&cursor={cursor}',
+            reverse('posts:tag_posts', kwargs={'name': 'план'}),
+            reverse('posts:tag_posts', kwargs={'name': 'план'})
+            + f'?cursor={cursor}',
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:comments', kwargs={'post_id': self.post.pk})
+            + '?cursor=' + encode_cursor(
+                (self.comment.created, self.comment.pk)
+            ),
+        ]
+        for url in urls:
+            self.assert_indexed(url)
@@ -1,7 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
 from ..models import Group, Post
@@ -10,6 +10,7 @@ from django.core.cache import cache
 User = get_user_model()
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class UrlAndTemplateTests(TestCase):
     @classmethod
     def setUpClass(cls):
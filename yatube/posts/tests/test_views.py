@@ -1,9 +1,17 @@
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
 from django.urls import reverse
 
+from .. import autocomplete
 from ..models import Group, Post
+from ..utils import encode_cursor
 
 User = get_user_model()
 
@@ -22,6 +30,7 @@ def generate_test_posts(count: int, author: User, group: Group):
     Post.objects.bulk_create(postlist)
 
 
+@override_settings(THUMBNAIL_WORKERS=0)
 class ViewTests(TestCase):
 
     @classmethod
@@ -157,3 +166,404 @@ class ViewTests(TestCase):
             len(response.context['page_obj']),
             Post.objects.all().count() % COUNT_POST_IN_PAGE
         )
+
+    def test_cursor_paginator_walks_whole_feed(self):
+        """Курсорная пагинация проходит ленту без пропусков и повторов."""
+        seen = []
+        url = reverse('posts:index')
+        while True:
+            response = self.guest_client.get(url)
+            page_obj = response.context['page_obj']
+            seen.extend(post.pk for post in page_obj)
+            if not page_obj.has_next():
+                break
+            url = reverse('posts:index') + '?cursor=' + page_obj.next_cursor
+        self.assertEqual(
+            seen, list(Post.objects.order_by('-pub_date', '-id').values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_cursor_paginator_previous_page(self):
+        """Курсор назад возвращает ту же страницу, с которой ушли."""
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(
+            reverse('posts:index')
+            + '?cursor=' + first.context['page_obj'].next_cursor
+        )
+        back = self.guest_client.get(
+            reverse('posts:index')
+            + '?cursor=' + second.context['page_obj'].previous_cursor
+        )
+        self.assertEqual(
+            list(back.context['page_obj']), list(first.context['page_obj'])
+        )
+        self.assertFalse(back.context['page_obj'].has_previous())
+
+    def test_cursor_paginator_bad_cursor(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=garbage'
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), COUNT_POST_IN_PAGE
+        )
+
+    def test_search_ranked_with_snippets(self):
+        """Поиск находит пост и подсвечивает совпадение в сниппете."""
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'указанием'}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), [self.post_with_group])
+        self.assertContains(response, '<mark>указанием</mark>')
+
+    def test_search_cursor_walks_results(self):
+        """Курсор по релевантности проходит все результаты без повторов."""
+        seen = []
+        params = {'q': 'тестовый'}
+        while True:
+            page_obj = self.guest_client.get(
+                reverse('posts:search'), params
+            ).context['page_obj']
+            seen.extend(post.pk for post in page_obj)
+            if not page_obj.has_next():
+                break
+            params['cursor'] = page_obj.next_cursor
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(set(seen), set(Post.objects.values_list(
+            'pk', flat=True
+        )))
+        scores = [
+            post.score for post in self.guest_client.get(
+                reverse('posts:search'), {'q': 'тестовый'}
+            ).context['page_obj']
+        ]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_search_index_follows_writes(self):
+        """Индекс обновляется при update() и экранирует HTML в сниппете."""
+        Post.objects.filter(pk=self.post_with_group.pk).update(
+            text='<b>жирный</b> текст'
+        )
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'указанием'}
+        )
+        self.assertEqual(list(response.context['page_obj']), [])
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': 'жирн'}
+        )
+        self.assertContains(response, '&lt;b&gt;<mark>жирный</mark>')
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'указанием'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.post_with_group]
+        )
+        self.assertIn(
+            'posts_post_fts', str(response.context['cl'].queryset.query)
+        )
+
+    def test_tag_feed(self):
+        """Хэштеги индексируются при записи, лента тега следует правкам."""
+        post = Post.objects.create(
+            text='Про #Django и #python', author=self.testuser
+        )
+        Post.objects.create(text='Ещё про #django', author=self.testuser)
+        url = reverse('posts:tag_posts', kwargs={'name': 'DJANGO'})
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            [p.text for p in response.context['page_obj']],
+            ['Ещё про #django', 'Про #Django и #python'],
+        )
+        self.assertContains(
+            response,
+            '<a href="{}">#python</a>'.format(
+                reverse('posts:tag_posts', kwargs={'name': 'python'})
+            ),
+        )
+
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Теперь только #python'},
+        )
+        response = self.guest_client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_backfill_tags(self):
+        generate_test_posts(3, self.testuser, self.group1)
+        Post.objects.filter(text__startswith='Тестовый текст').update(
+            text='Пост с #меткой'
+        )
+        call_command('backfill_tags', batch_size=2, stdout=StringIO())
+        response = self.guest_client.get(
+            reverse('posts:tag_posts', kwargs={'name': 'меткой'})
+        )
+        self.assertEqual(
+            len(response.context['page_obj']), COUNT_POST_IN_PAGE
+        )
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_api_feed_sparse_fields_and_cursor(self):
+        url = reverse('posts:api_group', kwargs={'slug': self.group1.slug})
+        with self.assertNumQueries(2):
+            data = self.guest_client.get(url, {'fields': 'id,author'}).json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author']['username'], 'TestUser')
+        self.assertIsNone(data['previous'])
+        rest = self.guest_client.get(data['next']).json()
+        self.assertEqual(len(rest['results']), 1)
+        self.assertIsNone(rest['next'])
+        self.assertEqual(set(rest['results'][0]), {'id', 'author'})
+        self.assertEqual(
+            self.guest_client.get(url, {'fields': 'id,secret'}).status_code,
+            400,
+        )
+
+    def test_api_etag(self):
+        url = reverse('posts:api_index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        post = Post.objects.create(text='Новый пост', author=self.testuser)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], post.pk)
+        etag = response['ETag']
+        Post.objects.get(pk=post.pk).delete()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.json()['results'][0]['id'], post.pk)
+        post = Post.objects.create(text='Новый пост', author=self.testuser)
+
+        url = reverse('posts:api_post', kwargs={'post_id': post.pk})
+        etag = self.guest_client.get(url)['ETag']
+        self.assertEqual(
+            self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            304,
+        )
+        post.comments.create(author=self.testuser, text='Комментарий')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['comments_count'], 1)
+
+    def test_api_etag_follows_renames(self):
+        url = reverse('posts:api_index')
+        etag = self.guest_client.get(url)['ETag']
+        group = Group.objects.get(pk=self.group1.pk)
+        group.title = 'Новое название'
+        group.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['group']['title'],
+            'Новое название',
+        )
+        etag = response['ETag']
+        author = User.objects.get(pk=self.testuser.pk)
+        author.username = 'RenamedUser'
+        author.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['author']['username'],
+            'RenamedUser',
+        )
+
+    def test_syndication_feeds(self):
+        url = reverse('posts:group_rss', kwargs={'slug': self.group1.slug})
+        response = self.guest_client.get(url)
+        self.assertEqual(
+            response['Content-Type'], 'application/rss+xml; charset=utf-8'
+        )
+        self.assertEqual(response.content.count(b'<item>'), 20)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(
+            text='Пост для ленты', author=self.testuser, group=self.group1
+        )
+        response = self.guest_client.get(
+            reverse('posts:group_atom', kwargs={'slug': self.group1.slug}),
+        )
+        self.assertIn('Пост для ленты', response.content.decode())
+        etag = response['ETag']
+        group = Group.objects.get(pk=self.group1.pk)
+        group.description = 'Обновлённое описание'
+        group.save()
+        response = self.guest_client.get(
+            reverse('posts:group_atom', kwargs={'slug': self.group1.slug}),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertIn('Обновлённое описание', response.content.decode())
+        Post.objects.get(text='Пост для ленты').delete()
+        response = self.guest_client.get(url)
+        self.assertNotIn('Пост для ленты', response.content.decode())
+        self.assertEqual(
+            self.guest_client.get(
+                reverse('posts:profile_rss', kwargs={'username': 'nobody'})
+            ).status_code,
+            404,
+        )
+
+    def test_conditional_get_for_pages(self):
+        post = self.post_with_group
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        post.comments.create(author=self.testuser, text='Свежий комментарий')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Свежий комментарий')
+
+        url = reverse('posts:profile', kwargs={'username': 'TestUser'})
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.get(pk=post.pk).delete()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(post, response.context['page_obj'])
+
+    def test_etag_follows_csrf_and_following_count(self):
+        follower = User.objects.create_user(username='Follower')
+        client = Client()
+        client.force_login(follower)
+        url = reverse('posts:profile', kwargs={'username': 'Follower'})
+        etag = client.get(url)['ETag']
+        client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'TestUser'}
+        ))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'подписок: 1')
+
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post_with_group.pk}
+        )
+        etag = client.get(url)['ETag']
+        client.cookies['csrftoken'] = 'rotated'
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_comments_are_paginated(self):
+        post = self.post_with_group
+        for i in range(25):
+            post.comments.create(author=self.testuser, text=f'Коммент {i}')
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Коммент 24')
+        more = reverse('posts:comments', kwargs={'post_id': post.pk})
+        more += f'?cursor={comments.next_cursor}'
+        self.assertContains(response, more)
+        response = self.guest_client.get(more)
+        self.assertTemplateUsed(response, 'posts/comment_list.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Коммент {i}' for i in range(4, -1, -1)],
+        )
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_comments_fragment_rejects_bad_requests(self):
+        """Фрагмент комментариев: 404 без поста и 400 на битый курсор."""
+        url = reverse(
+            'posts:comments', kwargs={'post_id': self.post_with_group.pk}
+        )
+        missing = reverse('posts:comments', kwargs={'post_id': 10 ** 6})
+        cases = {
+            missing: 404,
+            url + '?cursor=broken': 400,
+            url + '?cursor=' + encode_cursor((1.5, 1)): 400,
+            url: 200,
+        }
+        for address, status in cases.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertEqual(response.status_code, status)
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class AutocompleteTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        User.objects.create_user(username='alice')
+        User.objects.create_user(username='Alina')
+        User.objects.create_user(username='bob')
+        Group.objects.create(
+            title='Алгоритмы', slug='algo', description='Описание'
+        )
+
+    def suggest(self, prefix):
+        return self.guest_client.get(
+            reverse('posts:autocomplete'), {'q': prefix}
+        ).json()
+
+    def test_prefix_lookup(self):
+        data = self.suggest('ali')
+        self.assertEqual(
+            [user['username'] for user in data['users']], ['alice', 'Alina']
+        )
+        self.assertEqual(data['users'][0]['url'], '/profile/alice/')
+        self.assertEqual(
+            [group['slug'] for group in self.suggest('алг')['groups']],
+            ['algo'],
+        )
+        self.assertEqual(
+            [group['slug'] for group in self.suggest('al')['groups']],
+            ['algo'],
+        )
+
+    def test_index_updated_without_db(self):
+        """Регистрация и правка группы попадают в индекс без чтения из БД."""
+        self.suggest('a')
+        self.guest_client.post(reverse('users:signup'), {
+            'first_name': 'Ann',
+            'last_name': 'Lee',
+            'username': 'alex',
+            'email': 'alex@example.com',
+            'password1': 'Sup3rSecret!pass',
+            'password2': 'Sup3rSecret!pass',
+        })
+        group = Group.objects.get(slug='algo')
+        group.title = 'Базы данных'
+        group.save()
+        with self.assertNumQueries(0):
+            data = self.suggest('al')
+        self.assertEqual(
+            [user['username'] for user in data['users']],
+            ['alex', 'alice', 'Alina'],
+        )
+        self.assertEqual(
+            [group['title'] for group in data['groups']], ['Базы данных']
+        )
+        self.assertEqual(self.suggest('алг')['groups'], [])
+
+    def test_reload_runs_outside_lock(self):
+        """Перезагрузка индекса из БД не держит общую блокировку."""
+        load = autocomplete._load
+        locked = []
+
+        def checked_load():
+            locked.append(autocomplete._lock.locked())
+            return load()
+
+        cache.clear()
+        with mock.patch.object(autocomplete, '_load', checked_load):
+            data = self.suggest('bo')
+        self.assertEqual(locked, [False])
+        self.assertEqual(
+            [user['username'] for user in data['users']], ['bob']
+        )
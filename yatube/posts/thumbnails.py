@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import images, page_cache, sorl_compat
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+FAILED_KEY = 'thumb-failed:{}'
+FAILED_TIMEOUT = 60 * 60
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_file(image, alias):
+    """ImageFile миниатюры так, как её назовёт sorl, без генерации."""
+    geometry, options = settings.THUMBNAIL_GEOMETRIES[alias]
+    name = sorl_compat.thumbnail_name(ImageFile(image), geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def get_raw_many(keys):
+    """Сырые значения kvstore sorl одним обращением к кэшу и к БД."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        return {key: sorl_compat.get_raw(kvstore, key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(key__in=missing).values_list(
+            'key', 'value'
+        ))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(fetched)
+    return {
+        key: None if value == EMPTY_VALUE else value
+        for key, value in values.items()
+    }
+
+
+def ready_thumbnails(images, alias):
+    """Готовые миниатюры для списка картинок, None для остальных.
+
+    Все метаданные берутся из kvstore одним get_many, так что число
+    обращений не растёт с числом постов на странице. Отсутствующие
+    миниатюры ставятся в очередь.
+    """
+    files = [
+        thumbnail_file(image, alias) if image else None for image in images
+    ]
+    keys = [add_prefix(file.key) for file in files if file is not None]
+    values = get_raw_many(keys) if keys else {}
+    result = []
+    for image, file in zip(images, files):
+        value = file and values.get(add_prefix(file.key))
+        if file is not None and not value:
+            schedule_thumbnails(image.name)
+        result.append(deserialize_image_file(value) if value else None)
+    return result
+
+
+def ready_thumbnail(image, alias):
+    """Готовая миниатюра или None; отсутствующую ставит в очередь."""
+    return ready_thumbnails([image], alias)[0]
+
+
+def generate_thumbnails(name):
+    """Создаёт миниатюры всех размеров и адаптивные варианты для name.
+
+    Страницы лент с этой картинкой были собраны с запасным изображением,
+    поэтому их версии сбрасываются, а посты получают новый updated.
+    """
+    storage = Post._meta.get_field('image').storage
+    source = ImageFile(name, storage)
+    for geometry, options in settings.THUMBNAIL_GEOMETRIES.values():
+        get_thumbnail(source, geometry, **options)
+    posts = Post.objects.filter(image=name)
+    posts.update(
+        image_variants=json.dumps(images.generate_variants(name, storage)),
+        updated=timezone.now(),
+    )
+    scopes = set()
+    for post in posts.select_related('author', 'group'):
+        scopes.update(page_cache.post_scopes(post))
+    page_cache.bump_versions(*scopes)
+    return name
+
+
+def _failed_key(name):
+    return FAILED_KEY.format(hashlib.sha1(name.encode()).hexdigest())
+
+
+def _generate_logged(name):
+    # Генерацию запускает отрисовка страницы (ready_thumbnails), и битый
+    # или пропавший исходник должен оставить запасную картинку, а не
+    # превратить страницу в 500 — так же, как в фоновом пуле.
+    try:
+        generate_thumbnails(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        # Карточка без миниатюры не кэшируется, и без этой отметки каждая
+        # отрисовка снова пыталась бы обработать тот же битый файл.
+        cache.set(_failed_key(name), True, FAILED_TIMEOUT)
+
+
+def _run(name):
+    try:
+        _generate_logged(name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        connection.close()
+
+
+def drain():
+    """Дожидается задач пула и закрывает его; новый создастся по требованию."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+@receiver(setting_changed)
+def on_setting_changed(setting, **kwargs):
+    # Задачи пишут в MEDIA_ROOT, которое было при их постановке:
+    # после смены каталога они не должны дописывать в старый.
+    if setting in ('MEDIA_ROOT', 'THUMBNAIL_WORKERS'):
+        drain()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def queue_thumbnails(name):
+    """Ставит генерацию миниатюр в локальный пул потоков.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу, в текущем потоке.
+    """
+    if not name:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        _generate_logged(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    _get_executor().submit(_run, name)
+
+
+def schedule_thumbnails(name):
+    """queue_thumbnails после фиксации текущей транзакции.
+
+    Исходник, который недавно не удалось обработать, пропускается
+    до истечения FAILED_TIMEOUT.
+    """
+    if name and not cache.get(_failed_key(name)):
+        transaction.on_commit(lambda: queue_thumbnails(name))
@@ -1,7 +1,151 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+CURSOR_FORWARD = 'n'
+CURSOR_BACKWARD = 'p'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return f'~{float(value)!r}'
+
+
+def _decode_value(raw):
+    if raw.startswith('~'):
+        return float(raw[1:])
+    moment = parse_datetime(raw)
+    if moment is None:
+        raise ValueError(raw)
+    return moment
+
+
+def encode_cursor(position, direction=CURSOR_FORWARD):
+    """Упаковывает позицию (дата или число, id) в непрозрачный токен."""
+    value, pk = position
+    raw = f'{direction}|{_encode_value(value)}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, value, pk = raw.split('|')
+        value = _decode_value(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if direction not in (CURSOR_FORWARD, CURSOR_BACKWARD):
+        return None
+    return (value, pk), direction
+
+
+def keyset_filter(position, keys, backward=False):
+    """Условие «строго после позиции» для сортировки по убыванию keys."""
+    (moment, pk), (moment_key, pk_key) = position, keys
+    lookup = 'gt' if backward else 'lt'
+    return (
+        Q(**{f'{moment_key}__{lookup}': moment})
+        | Q(**{moment_key: moment, f'{pk_key}__{lookup}': pk})
+    )
+
+
+def keyset_slice(queryset, keys, position, backward, limit):
+    direction = '' if backward else '-'
+    queryset = queryset.order_by(*(direction + key for key in keys))
+    if position is not None:
+        queryset = queryset.filter(keyset_filter(position, keys, backward))
+    return list(queryset[:limit])
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по (дата, id) c непрозрачным ?cursor=.
+
+    Каждая страница — один индексный запрос с LIMIT, стоимость которого
+    не зависит от глубины листания. Общего числа страниц пагинатор не знает:
+    номер страницы и num_pages описывают только её соседей, чтобы обычные
+    has_next()/has_previous() у Page продолжали работать.
+    """
+    is_cursor = True
+    value_type = datetime
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id')):
+        super().__init__(object_list, per_page)
+        self.keys = keys
+
+    def is_valid_cursor(self, cursor):
+        """Курсор не задан или это целый токен под ключи пагинатора."""
+        if not cursor:
+            return True
+        decoded = decode_cursor(cursor)
+        return decoded is not None and isinstance(
+            decoded[0][0], self.value_type
+        )
+
+    def get_page(self, cursor):
+        if not cursor or not self.is_valid_cursor(cursor):
+            return self.page(None)
+        position, direction = decode_cursor(cursor)
+        return self.page(position, direction == CURSOR_BACKWARD)
+
+    def page(self, position, backward=False):
+        rows = self.fetch(position, backward, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backward:
+            rows.reverse()
+        has_next = has_more or (backward and position is not None)
+        has_previous = has_more if backward else position is not None
+        page = Page(rows, 2 if has_previous else 1, self)
+        self.num_pages = page.number + 1 if has_next else page.number
+        page.next_cursor = page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = encode_cursor(self.position(rows[-1]))
+        if rows and has_previous:
+            page.previous_cursor = encode_cursor(
+                self.position(rows[0]), CURSOR_BACKWARD
+            )
+        return page
+
+    def fetch(self, position, backward, limit):
+        """Первые limit строк после позиции в порядке обхода."""
+        return keyset_slice(
+            self.object_list, self.keys, position, backward, limit
+        )
+
+    def position(self, obj):
+        return tuple(getattr(obj, key) for key in self.keys)
+
+
+class CappedCountPaginator(Paginator):
+    """Paginator, который считает строки не дальше COUNT_CAP.
+
+    Точный COUNT(*) по таблице в миллионы строк читает её целиком;
+    подзапрос с LIMIT останавливается на пороге. Страницы дальше порога
+    недоступны — для них есть фильтры и иерархия дат.
+    """
+    COUNT_CAP = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.COUNT_CAP].count()
 
 
 def paginate_page(request, post_list, post_per_page=10):
-    paginator = Paginator(post_list, post_per_page)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return page_obj
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        # Совместимость со старыми ссылками вида ?page=N.
+        paginator = Paginator(post_list, post_per_page)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(post_list, post_per_page)
+    return paginator.get_page(request.GET.get('cursor'))
@@ -1,25 +1,62 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.db.models import OuterRef, Subquery
+from django.http import (
+    HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.views.decorators.http import condition
 
+from .autocomplete import suggest
+from .counters import get_user_stats
+from .exporter import EXPORTS, export_lines, parse_filters
+from .follow_feed import follow_feed_page
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
-from .utils import paginate_page
+from .models import Comment, Follow, Group, Post, Tag
+from .page_cache import (
+    author_scope, cache_feed, feed_etag, get_versions, group_scope,
+    request_etag, tag_scope
+)
+from .search import search_page
+from .tags import TagPaginator, normalize_tag
+from .thumbnails import schedule_thumbnails
+from .utils import CursorPaginator, paginate_page
 
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
 
-@cache_page(20)
+
+def _group_scopes(slug):
+    return [group_scope(slug)]
+
+
+def _author_scopes(username):
+    return [author_scope(username)]
+
+
+@cache_feed(lambda: ['index'])
 def index(request):
-    page_obj = paginate_page(request, Post.objects.all())
+    page_obj = paginate_page(
+        request, Post.objects.select_related('author', 'group')
+    )
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=feed_etag(_group_scopes))
+@cache_feed(_group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    page_obj = paginate_page(request, group.posts.all())
+    page_obj = paginate_page(
+        request, group.posts.select_related('author', 'group')
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -27,32 +64,156 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context=context)
 
 
+@cache_feed(lambda name: [tag_scope(normalize_tag(name))])
+def tag_posts(request, name):
+    tag = get_object_or_404(Tag, name=normalize_tag(name))
+    paginator = TagPaginator(tag, 10)
+    context = {
+        'tag': tag,
+        'page_obj': paginator.get_page(request.GET.get('cursor')),
+    }
+    return render(request, 'posts/tag_list.html', context)
+
+
+@condition(etag_func=feed_etag(_author_scopes))
+@cache_feed(_author_scopes)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    page_obj = paginate_page(request, author.posts.all())
+    page_obj = paginate_page(
+        request, author.posts.select_related('author', 'group')
+    )
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user, author=author
     ).exists()
     context = {
         'following': following,
         'author': author,
+        'author_stats': get_user_stats(author),
         'page_obj': page_obj,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def _post_etag(request, post_id):
+    """ETag поста одним запросом по первичному ключу и индексу комментариев.
+
+    Версия ленты автора меняется с его новыми и удалёнными постами,
+    подписками и готовыми превью.
+    """
+    last_comment = Comment.objects.filter(post=OuterRef('pk')).order_by(
+        '-created'
+    ).values('created')[:1]
+    state = Post.objects.filter(pk=post_id).order_by().annotate(
+        last_comment=Subquery(last_comment)
+    ).values_list(
+        'updated', 'comments_count', 'last_comment', 'author__username',
+        'group__slug', 'group__title',
+    ).first()
+    if state is None:
+        return None
+    return request_etag(
+        request, *state, *get_versions(_author_scopes(state[3]))
+    )
+
+
+def _comments_paginator(post_id):
+    """Комментарии от новых к старым по индексу (post, created)."""
+    return CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        keys=('created', 'id'),
+    )
+
+
+@condition(etag_func=_post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    comments = _comments_paginator(post.pk).get_page(None)
     comment_form = CommentForm()
     context = {
         'post': post,
+        'author_stats': get_user_stats(post.author),
         'comments': comments,
         'form': comment_form,
+        'sizes': settings.IMAGE_VARIANT_SIZES,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@condition(etag_func=_post_etag)
+def comments(request, post_id):
+    """Фрагмент со следующей порцией комментариев для страницы поста.
+
+    Битый курсор — ошибка, а не первая страница: иначе «Показать ещё»
+    дописал бы на страницу уже показанные комментарии.
+    """
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    paginator = _comments_paginator(post_id)
+    cursor = request.GET.get('cursor')
+    if not paginator.is_valid_cursor(cursor):
+        return HttpResponseBadRequest('Неверный курсор')
+    context = {
+        'post_id': post_id,
+        'comments': paginator.get_page(cursor),
+    }
+    return render(request, 'posts/comment_list.html', context)
+
+
+def autocomplete(request):
+    users, groups = suggest(
+        request.GET.get('q', ''), settings.AUTOCOMPLETE_LIMIT
+    )
+    return JsonResponse({
+        'users': [
+            {
+                'username': username,
+                'url': reverse('posts:profile', args=[username]),
+            }
+            for username in users
+        ],
+        'groups': [
+            {
+                'slug': slug,
+                'title': title,
+                'url': reverse('posts:group_list', args=[slug]),
+            }
+            for slug, title in groups
+        ],
+    })
+
+
+@staff_member_required
+def export(request):
+    """Потоковая выгрузка постов или комментариев для администраторов."""
+    kind = request.GET.get('type', 'post')
+    fmt = request.GET.get('format', 'ndjson')
+    if kind not in EXPORTS or fmt not in EXPORT_CONTENT_TYPES:
+        return HttpResponseBadRequest('Неизвестный тип или формат')
+    try:
+        filters = parse_filters(request.GET)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    response = StreamingHttpResponse(
+        export_lines(kind, fmt, **filters),
+        content_type=EXPORT_CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{kind}s.{fmt}"'
+    )
+    return response
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': search_page(request, query),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST, files=request.FILES or None)
@@ -60,6 +221,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        schedule_thumbnails(post.image.name)
         return redirect('posts:profile', request.user.username)
     context = {
         'form': form,
@@ -82,6 +244,8 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         post.save()
+        if 'image' in form.changed_data:
+            schedule_thumbnails(post.image.name)
         return redirect('posts:post_detail', post_id)
 
     context = {
@@ -111,9 +275,7 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    page_obj = paginate_page(
-        request, Post.objects.filter(author__following__user=request.user)
-    )
+    page_obj = follow_feed_page(request, request.user)
     context = {
         'page_obj': page_obj,
     }
@@ -105,9 +105,54 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+# 'X-Sendfile' (Apache, lighttpd) или 'X-Accel-Redirect' (nginx): файлы
+# отдаёт фронтовой сервер. Для nginx MEDIA_ACCEL_PREFIX — internal-location,
+# смотрящий в MEDIA_ROOT.
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
 
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Сколько пользователей и групп отдаёт автодополнение.
+AUTOCOMPLETE_LIMIT = 10
+
+# Комментариев на странице поста и в каждой догружаемой порции.
+COMMENTS_PER_PAGE = 20
+
+# Стратегия ленты подписок: 'join', 'materialized' или 'merge'.
+FOLLOW_FEED_STRATEGY = 'materialized'
+
+# Страницы лент кэшируются по версиям лент и сбрасываются при записи,
+# поэтому могут жить долго. Версии должны лежать в общем для всех
+# воркеров кэше (memcached/redis), иначе воркеры не увидят инвалидацию.
+FEED_CACHE_TIMEOUT = 60 * 60
+
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Размеры миниатюр, которые готовятся заранее, по псевдонимам шаблонов.
+THUMBNAIL_GEOMETRIES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Потоки локального пула миниатюр; 0 — генерировать сразу.
+THUMBNAIL_WORKERS = 2
+
+# Адаптивные варианты картинок постов (WebP и, если есть, AVIF).
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+IMAGE_VARIANT_SIZES = '(max-width: 960px) 100vw, 960px'
+IMAGE_VARIANT_DIR = 'posts/variants/'
+
+# Загрузки больше этого размера пишутся во временный файл, а не в память.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+
+# Ограничения на картинки постов; проверяются по заголовку, до декодирования.
+IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+# Оригиналы уменьшаются до этой стороны, EXIF-поворот применяется,
+# метаданные удаляются. Процессы пула обработки; 0 — в текущем процессе.
+IMAGE_MAX_SIDE = 2560
+IMAGE_INGEST_WORKERS = 2